@@ -7,7 +7,10 @@ from flask import Flask, redirect, url_for, render_template  # ← Added render_
 from flask_login import LoginManager, current_user
 from flask_sqlalchemy import SQLAlchemy
 from config import Config
-from models import db, User
+from models import User, configure_db
+import schema
+import jobs
+import media
 
 # ----------------------------------------------------------------------
 # Import ALL blueprints (including the new SkillShare)
@@ -34,15 +37,21 @@ def create_app():
     # --------------------------------------------------------------
     # Initialise extensions
     # --------------------------------------------------------------
-    db.init_app(app)
+    configure_db(app)
+
+    # Schema is checked/upgraded once per process, not on every request
+    with app.app_context():
+        schema.upgrade()
+        jobs.expire_stale()   # left queued/running by the previous process
+        media.expire_stale()  # likewise for video processing
 
     login_manager = LoginManager(app)
     login_manager.login_view = 'auth.login'
 
     @login_manager.user_loader
     def load_user(uid):
-        # SQLAlchemy 2.0+ style
-        return db.session.get(User, int(uid))
+        # Cached identity columns only, see identity.py
+        return User.load_identity(int(uid))
 
     # --------------------------------------------------------------
     # Register blueprints
@@ -59,9 +68,34 @@ def create_app():
     # --------------------------------------------------------------
     @app.cli.command("init-db")
     def init_db():
-        """Create all tables (including SkillPost & Like)."""
-        db.create_all()
-        print("Database tables created!")
+        """Create all tables and apply pending schema migrations."""
+        version = schema.upgrade()
+        print(f"Database ready (schema version {version})!")
+
+    @app.cli.command("backfill-learning")
+    def backfill_learning():
+        """Move legacy User.learned strings into the learning_event table."""
+        from models import backfill_learning_events
+        print(f"Backfilled {backfill_learning_events()} learning events.")
+
+    @app.cli.command("prune-cache")
+    def prune_cache():
+        """Evict expired API cache entries, stale transcript index rows and abandoned uploads."""
+        from cache import cache
+        from transcript_index import transcript_index
+        from routes.youtube import CACHE_TTL
+        import uploads
+        cache.evict()
+        transcript_index.prune(CACHE_TTL['transcript'])
+        print(f"Cache pruned! Dropped {uploads.prune()} abandoned uploads.")
+
+    @app.cli.command("process-videos")
+    def process_videos():
+        """Transcode SkillShare posts left in 'processing' (e.g. after a restart)."""
+        ids = media.pending()
+        for post_id in ids:
+            media.process(post_id)
+        print(f"Processed {len(ids)} videos.")
 
     # --------------------------------------------------------------
     # Root route – Serve GoalVerse 2.0 landing page (goalverse-github-ui.html)
@@ -79,13 +113,6 @@ def create_app():
             return redirect(url_for('dashboard.index'))
         return redirect(url_for('auth.login'))
 
-    # --------------------------------------------------------------
-    # Ensure tables are created on first request (safe for dev)
-    # --------------------------------------------------------------
-    @app.before_request
-    def create_tables():
-        db.create_all()
-
     # --------------------------------------------------------------
     # Debug – show first 10 chars of API keys (helps spot missing .env)
     # --------------------------------------------------------------
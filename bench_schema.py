@@ -0,0 +1,58 @@
+# bench_schema.py
+"""Measure what the old per-request ``db.create_all()`` hook cost.
+
+Builds a throwaway app on a temporary SQLite file with the real models,
+then times a trivial route with and without a ``before_request`` hook that
+calls ``create_all()``, the way app.py used to.
+
+    python bench_schema.py [requests]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from flask import Flask
+
+from models import db, configure_db
+import schema
+
+
+def build_app(path, hook):
+    app = Flask(__name__)
+    app.config.from_object('config.Config')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    configure_db(app)
+    with app.app_context():
+        schema.upgrade()
+
+    if hook:
+        @app.before_request
+        def create_tables():
+            db.create_all()
+
+    @app.route('/ping')
+    def ping():
+        return 'ok'
+
+    return app
+
+
+def bench(app, n):
+    client = app.test_client()
+    client.get('/ping')   # warm up
+    start = time.perf_counter()
+    for _ in range(n):
+        client.get('/ping')
+    return (time.perf_counter() - start) / n * 1000
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as tmp:
+        with_hook = bench(build_app(os.path.join(tmp, 'hook.db'), hook=True), n)
+        without_hook = bench(build_app(os.path.join(tmp, 'once.db'), hook=False), n)
+    print(f"{n} requests per run")
+    print(f"create_all() on every request: {with_hook:.3f} ms/request")
+    print(f"schema upgraded once at start: {without_hook:.3f} ms/request")
+    print(f"overhead removed:              {with_hook - without_hook:.3f} ms/request")
@@ -0,0 +1,129 @@
+# cache.py
+"""Small persistent key/value cache shared by every worker process.
+
+Entries live in a SQLite file next to the app database, so all gunicorn
+workers (and restarts) see the same data. Each entry carries its own
+expiry, and the table is trimmed back to ``max_entries`` by evicting the
+least recently used rows. Recency is approximate: a hit only rewrites
+``accessed_at`` once it is TOUCH_INTERVAL old, so reads stay reads and
+don't queue on SQLite's single writer. Values must be JSON-serialisable.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+MISSING = object()
+
+# Trim the table every this many writes instead of counting rows on each one
+EVICT_EVERY = 200
+
+# Seconds a hit may leave accessed_at alone (LRU is accurate to about this)
+TOUCH_INTERVAL = 300
+
+
+class SQLiteCache:
+    def __init__(self, path, max_entries=20000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._counters = {}   # namespace -> {'hits': n, 'misses': n}
+
+    # ----------------- Connection -----------------
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entry (
+                    namespace   TEXT NOT NULL,
+                    key         TEXT NOT NULL,
+                    value       TEXT NOT NULL,
+                    expires_at  REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )""")
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entry_accessed ON cache_entry (accessed_at)')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, namespace, field):
+        with self._lock:
+            counters = self._counters.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counters[field] += 1
+
+    # ----------------- Public API -----------------
+    def get(self, namespace, key, default=MISSING):
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                'SELECT value, expires_at, accessed_at FROM cache_entry WHERE namespace = ? AND key = ?',
+                (namespace, key)).fetchone()
+            if row is None or row[1] < now:
+                self._count(namespace, 'misses')
+                return default
+            if now - row[2] > TOUCH_INTERVAL:
+                conn.execute('UPDATE cache_entry SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                             (now, namespace, key))
+        except sqlite3.Error as e:
+            print("Cache read error:", e)
+            self._count(namespace, 'misses')
+            return default
+        self._count(namespace, 'hits')
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl):
+        now = time.time()
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO cache_entry (namespace, key, value, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (namespace, key, json.dumps(value), now + ttl, now))
+        except sqlite3.Error as e:
+            print("Cache write error:", e)
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def delete(self, namespace, key):
+        try:
+            self._conn().execute('DELETE FROM cache_entry WHERE namespace = ? AND key = ?', (namespace, key))
+        except sqlite3.Error as e:
+            print("Cache delete error:", e)
+
+    def evict(self):
+        """Drop expired rows, then the least recently used beyond max_entries."""
+        try:
+            conn = self._conn()
+            conn.execute('DELETE FROM cache_entry WHERE expires_at < ?', (time.time(),))
+            conn.execute("""
+                DELETE FROM cache_entry WHERE rowid IN (
+                    SELECT rowid FROM cache_entry ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""", (self.max_entries,))
+        except sqlite3.Error as e:
+            print("Cache evict error:", e)
+
+    def stats(self):
+        """Hit/miss counters for this process plus the shared entry count."""
+        with self._lock:
+            namespaces = {ns: dict(c) for ns, c in self._counters.items()}
+        try:
+            size = self._conn().execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        return {'entries': size, 'max_entries': self.max_entries, 'namespaces': namespaces}
+
+
+cache = SQLiteCache(Config.CACHE_DB_PATH, Config.CACHE_MAX_ENTRIES)
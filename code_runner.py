@@ -0,0 +1,277 @@
+# code_runner.py
+"""Execution backends behind /code/run.
+
+Every backend's ``run`` returns the same result dicts:
+
+    {'status': 'done', 'output': str, 'error': str}
+    {'status': 'pending', 'token': str}     # Judge0 only: poll with judge0.status(token)
+
+Python can run locally in a pool of pre-started, resource-limited
+interpreter processes inside a bubblewrap sandbox; everything else (and
+Python too unless LOCAL_RUNNER_ENABLED is set) goes to Judge0.
+``backend_for(lang)`` picks one.
+"""
+import base64
+import os
+from abc import ABC, abstractmethod
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from config import Config
+from http_client import client
+
+LANG_IDS = {'python': 71, 'javascript': 63, 'java': 62, 'c': 50, 'cpp': 54}
+
+
+class ExecutionBackend(ABC):
+    @abstractmethod
+    def run(self, code, lang):
+        """Run ``code`` and return a result dict (see the module docstring)."""
+
+
+# ----------------- Judge0 -----------------
+class Judge0Backend(ExecutionBackend):
+    # Judge0 status ids: 1 = In Queue, 2 = Processing, anything higher is final
+    PENDING_STATUSES = (1, 2)
+    TIMEOUT = (3, 15)   # connect, read (wait=true holds the read open while the code runs)
+
+    def __init__(self, url):
+        self.url = url
+
+    @staticmethod
+    def _b64(text):
+        return base64.b64decode(text).decode(errors='replace') if text else ''
+
+    def _result(self, data, token=None):
+        if 'status' not in data:
+            if 'token' in data:
+                # Instance without wait support (or still queued): poll by token
+                return {'status': 'pending', 'token': data['token']}
+            raise RuntimeError(data.get('error', 'Submission failed'))
+
+        status = data['status']
+        if status['id'] in self.PENDING_STATUSES:
+            return {'status': 'pending', 'token': data.get('token', token)}
+        output = self._b64(data.get('stdout'))
+        error = self._b64(data.get('stderr')) or self._b64(data.get('compile_output'))
+        if status['id'] != 3 and not error:
+            error = status.get('description', 'Execution failed')
+        return {'status': 'done', 'output': output, 'error': error}
+
+    def run(self, code, lang):
+        payload = {
+            "source_code": base64.b64encode(code.encode()).decode(),
+            "language_id": LANG_IDS.get(lang, LANG_IDS['python']),
+            "stdin": ""
+        }
+        # wait=true lets Judge0 answer with the finished run in one round trip.
+        # Not retried: a resend after a lost reply would run the code twice.
+        r = client.post(f"{self.url}?base64_encoded=true&wait=true&fields=*",
+                              json=payload, timeout=self.TIMEOUT)
+        return self._result(r.json())
+
+    def status(self, token):
+        """One look at a run that came back pending."""
+        res = client.get(f"{self.url}/{token}?base64_encoded=true&fields=*", timeout=self.TIMEOUT)
+        return self._result(res.json(), token)
+
+
+# ----------------- Local Python -----------------
+# Runs inside each pool process. It applies its own rlimits, then blocks on
+# stdin until a snippet arrives - that wait is the "warm" state. Once the
+# code is read, an audit hook refuses sockets, new processes and ctypes.
+# None of that stops open(): the isolation comes from the sandbox around
+# the interpreter (see LocalPythonBackend._command), which gives it its own
+# uid, pid and network namespaces and a filesystem with nothing but the
+# read-only Python install and an empty work directory - no app code, .env,
+# instance/ or /proc of the web worker.
+_BOOTSTRAP = r'''
+import os, resource, sys, traceback
+cpu, mem, fsize = map(int, sys.argv[1:4])
+used = int(resource.getrusage(resource.RUSAGE_SELF).ru_utime) + 1
+resource.setrlimit(resource.RLIMIT_CPU, (used + cpu, used + cpu))
+resource.setrlimit(resource.RLIMIT_AS, (mem, mem))
+resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+resource.setrlimit(resource.RLIMIT_NOFILE, (32, 32))
+source = sys.stdin.read()
+sys.stdin = open(os.devnull)
+
+BLOCKED = ('socket.', 'subprocess.', 'os.system', 'os.exec', 'os.spawn', 'os.posix_spawn', 'os.fork', 'os.kill')
+def guard(event, args):
+    if event.startswith(BLOCKED) or (event == 'import' and args[0] in ('ctypes', '_ctypes')):
+        what = f"import {args[0]}" if event == 'import' else event
+        raise PermissionError(f"{what} is not allowed here")
+sys.addaudithook(guard)
+
+try:
+    exec(compile(source, '<snippet>', 'exec'), {'__name__': '__main__'})
+except SystemExit:
+    raise
+except BaseException as e:
+    traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+    sys.exit(1)
+'''
+
+
+class LocalPythonBackend(ExecutionBackend):
+    MAX_OUTPUT = 64 * 1024   # per stream; the run is killed once it writes more
+    NOBODY = 65534
+    # Host paths the interpreter needs, mounted read-only (missing ones are skipped)
+    SYSTEM_PATHS = ('/usr', '/bin', '/lib', '/lib64', '/etc/alternatives')
+
+    def __init__(self, workers=2, cpu_seconds=2, memory_mb=256, wall_seconds=5, sandbox='bwrap'):
+        self.workers = workers
+        self.wall_seconds = wall_seconds
+        self.sandbox = sandbox
+        self.limits = [str(cpu_seconds), str(memory_mb * 1024 * 1024), str(1024 * 1024)]
+        self._idle = []
+        self._spawning = 0   # processes being started for the pool right now
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def available(self):
+        """Whether snippets can be isolated here ('none' is for local development only)."""
+        return self.sandbox == 'none' or shutil.which('bwrap') is not None
+
+    def _command(self, workdir):
+        python = [sys.executable, '-I', '-c', _BOOTSTRAP, *self.limits]
+        if self.sandbox == 'none':
+            return python
+        cmd = ['bwrap', '--unshare-all', '--die-with-parent', '--new-session',
+               '--uid', str(self.NOBODY), '--gid', str(self.NOBODY)]
+        prefixes = {os.path.dirname(os.path.dirname(os.path.realpath(sys.executable))),
+                    sys.prefix, sys.base_prefix}
+        for path in (*self.SYSTEM_PATHS, *sorted(prefixes)):
+            cmd += ['--ro-bind-try', path, path]
+        cmd += ['--proc', '/proc', '--dev', '/dev', '--tmpfs', '/tmp',
+                '--bind', workdir, '/work', '--chdir', '/work',
+                '--clearenv', '--setenv', 'PATH', '/usr/bin:/bin', '--setenv', 'LANG', 'C.UTF-8']
+        return cmd + ['--', *python]
+
+    def _spawn(self):
+        workdir = tempfile.mkdtemp(prefix='snippet-')
+        proc = subprocess.Popen(
+            self._command(workdir),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=workdir, env={'PATH': '/usr/bin:/bin', 'LANG': 'C.UTF-8'},
+            start_new_session=True,
+        )
+        proc.workdir = workdir
+        return proc
+
+    def _short(self):
+        """Whether the pool is below target, counting spawns in progress. Hold the lock."""
+        return len(self._idle) + self._spawning < self.workers
+
+    def _refill(self):
+        while True:
+            with self._lock:
+                if not self._short():
+                    return
+                self._spawning += 1
+            try:
+                proc = self._spawn()
+            except BaseException:
+                with self._lock:
+                    self._spawning -= 1
+                raise
+            with self._lock:
+                self._spawning -= 1
+                self._idle.append(proc)
+
+    def _take(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use in this (possibly forked) process: pool is empty
+                self._idle, self._spawning, self._pid = [], 0, os.getpid()
+            proc = self._idle.pop() if self._idle else None
+            refill = self._short()
+        if refill:
+            threading.Thread(target=self._refill, daemon=True).start()
+        return proc or self._spawn()
+
+    @staticmethod
+    def _kill(proc):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _collect(self, proc, code):
+        """Feed the snippet in, then read both pipes as the output arrives.
+
+        Returns (stdout, stderr, problem); problem is set when the run was
+        killed for going over the wall clock or MAX_OUTPUT.
+        """
+        deadline = time.monotonic() + self.wall_seconds
+        try:
+            proc.stdin.write(code.encode())
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        buffers = {proc.stdout: bytearray(), proc.stderr: bytearray()}
+        problem = None
+        with selectors.DefaultSelector() as sel:
+            for pipe in buffers:
+                sel.register(pipe, selectors.EVENT_READ)
+            while sel.get_map() and problem is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    problem = 'Time limit exceeded'
+                    break
+                for key, _ in sel.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        sel.unregister(key.fileobj)
+                        continue
+                    buf = buffers[key.fileobj]
+                    buf += chunk
+                    if len(buf) > self.MAX_OUTPUT:
+                        problem = 'Output limit exceeded'
+                        break
+        if problem:
+            self._kill(proc)
+        proc.wait()
+        for pipe in buffers:
+            pipe.close()
+        out, err = (bytes(buffers[p][:self.MAX_OUTPUT]).decode(errors='replace')
+                    for p in (proc.stdout, proc.stderr))
+        return out, err, problem
+
+    def run(self, code, lang='python'):
+        proc = self._take()
+        try:
+            stdout, stderr, problem = self._collect(proc, code)
+        finally:
+            self._kill(proc)   # anything it left behind in its process group
+            shutil.rmtree(proc.workdir, ignore_errors=True)
+
+        if problem is None and proc.returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+            problem = 'Time limit exceeded'
+        if problem:
+            stderr = f"{stderr}\n{problem}" if stderr else problem
+        return {'status': 'done', 'output': stdout, 'error': stderr}
+
+
+judge0 = Judge0Backend(Config.JUDGE0_URL)
+local_python = LocalPythonBackend(
+    workers=Config.LOCAL_RUNNER_WORKERS,
+    cpu_seconds=Config.LOCAL_RUNNER_CPU_SECONDS,
+    memory_mb=Config.LOCAL_RUNNER_MEMORY_MB,
+    wall_seconds=Config.LOCAL_RUNNER_WALL_SECONDS,
+    sandbox=Config.LOCAL_RUNNER_SANDBOX,
+)
+if Config.LOCAL_RUNNER_ENABLED and not local_python.available():
+    print("LOCAL_RUNNER_ENABLED but bwrap isn't installed; Python runs go to Judge0")
+
+
+def backend_for(lang):
+    if lang == 'python' and Config.LOCAL_RUNNER_ENABLED and local_python.available():
+        return local_python
+    return judge0
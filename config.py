@@ -3,11 +3,104 @@ from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent
 
+def _database_url():
+    """DATABASE_URL if set (Heroku-style postgres:// is accepted), else the local SQLite file"""
+    url = os.getenv('DATABASE_URL')
+    if not url:
+        return f"sqlite:///{BASE_DIR / 'instance' / 'app.db'}"
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def _engine_options(url):
+    if url.startswith('sqlite'):
+        # Pragmas are applied per connection in models.configure_db
+        return {}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-change-me')
-    SQLALCHEMY_DATABASE_URI = f"sqlite:///{BASE_DIR / 'instance' / 'app.db'}"
+    SQLALCHEMY_DATABASE_URI = _database_url()
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # SQLite tuning (ignored for other databases)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_KB', 20000))
+
     # API KEYS (loaded from .env)
     YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
     GEMINI_API_KEY  = os.getenv('GEMINI_API_KEY')
+
+    # Logged-in user identity kept per process between requests (see identity.py)
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))
+
+    # Shared API response cache (see cache.py)
+    CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', str(BASE_DIR / 'instance' / 'cache.db'))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 20000))
+    TRANSCRIPT_INDEX_PATH = os.getenv('TRANSCRIPT_INDEX_PATH', str(BASE_DIR / 'instance' / 'transcripts.db'))
+
+    # YouTube Data API budget per Pacific day (see quota.py); floors are fractions of it
+    YOUTUBE_DAILY_QUOTA = int(os.getenv('YOUTUBE_DAILY_QUOTA', 10000))
+    QUOTA_COMMENTS_FLOOR = float(os.getenv('QUOTA_COMMENTS_FLOOR', 0.3))
+    QUOTA_TRANSCRIPTS_FLOOR = float(os.getenv('QUOTA_TRANSCRIPTS_FLOOR', 0.1))
+
+    # Background job threads per process (see jobs.py)
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+    JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 120))   # seconds before an unfinished job counts as lost
+    GEMINI_TIMEOUT = int(os.getenv('GEMINI_TIMEOUT', 60))   # per generate_content call; keep below JOB_TIMEOUT
+    WRITE_WORKERS = int(os.getenv('WRITE_WORKERS', 2))  # deferred DB writes, e.g. playlist upserts
+
+    # Cache of generated docs/quiz questions (see routes/gemini.py)
+    GEN_CACHE_DB_PATH = os.getenv('GEN_CACHE_DB_PATH', str(BASE_DIR / 'instance' / 'generations.db'))
+    GEN_CACHE_MAX_ENTRIES = int(os.getenv('GEN_CACHE_MAX_ENTRIES', 5000))
+    GEN_CACHE_TTL = int(os.getenv('GEN_CACHE_TTL', 7 * 86400))
+
+    # Outbound HTTP (see http_client.py)
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+    HTTP_CIRCUIT_FAILURES = int(os.getenv('HTTP_CIRCUIT_FAILURES', 5))
+    HTTP_CIRCUIT_COOLDOWN = int(os.getenv('HTTP_CIRCUIT_COOLDOWN', 30))
+
+    # Code runner (point at judge0_stub.py for local testing)
+    JUDGE0_URL = os.getenv('JUDGE0_URL', 'https://ce.judge0.com/submissions')
+
+    # Local Python runner (see code_runner.py); other languages use Judge0.
+    # Off by default; needs bubblewrap (bwrap) for isolation. SANDBOX=none
+    # runs snippets with the web worker's file access - local development only.
+    LOCAL_RUNNER_ENABLED = os.getenv('LOCAL_RUNNER_ENABLED', '0') == '1'
+    LOCAL_RUNNER_SANDBOX = os.getenv('LOCAL_RUNNER_SANDBOX', 'bwrap')
+    LOCAL_RUNNER_WORKERS = int(os.getenv('LOCAL_RUNNER_WORKERS', 2))
+    LOCAL_RUNNER_CPU_SECONDS = int(os.getenv('LOCAL_RUNNER_CPU_SECONDS', 2))
+    LOCAL_RUNNER_MEMORY_MB = int(os.getenv('LOCAL_RUNNER_MEMORY_MB', 256))
+    LOCAL_RUNNER_WALL_SECONDS = int(os.getenv('LOCAL_RUNNER_WALL_SECONDS', 5))
+
+    # SkillShare uploads (see uploads.py). Videos arrive in chunks, so one
+    # request body never needs to be bigger than a chunk plus form overhead;
+    # only the single-request /skillshare/upload fallback allows UPLOAD_MAX_BYTES.
+    UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 500 * 1024 * 1024))
+    UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', 8 * 1024 * 1024))
+    UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 86400))
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', UPLOAD_CHUNK_BYTES + 1024 * 1024))
+
+    # How /skillshare/media hands video bytes to the front server: '' streams
+    # them from Flask (sendfile for whole files under gunicorn), 'x-sendfile'
+    # for Apache/lighttpd, 'x-accel' for nginx with an internal location at
+    # MEDIA_ACCEL_PREFIX aliased to static/uploads/.
+    MEDIA_ACCEL = os.getenv('MEDIA_ACCEL', '')
+    MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-uploads/')
+    USE_X_SENDFILE = MEDIA_ACCEL == 'x-sendfile'
+
+    # Post-upload transcoding (see media.py)
+    TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', 1))
+    TRANSCODE_MAX_BITRATE = int(os.getenv('TRANSCODE_MAX_BITRATE', 2_500_000))   # bits/s
+    TRANSCODE_MAX_HEIGHT = int(os.getenv('TRANSCODE_MAX_HEIGHT', 720))
+    TRANSCODE_TIMEOUT = int(os.getenv('TRANSCODE_TIMEOUT', 3600))   # processing longer than this was lost
@@ -0,0 +1,181 @@
+# http_client.py
+"""One pooled, retrying HTTP client for every outbound integration.
+
+    from http_client import client
+    client.get(url, params=..., timeout=5).json()
+
+* Keep-alive pools per host (one ``requests.Session``), so repeat calls to
+  googleapis.com or Judge0 skip the TCP + TLS handshake.
+* A default (connect, read) timeout on every call - nothing can hang a
+  worker forever.
+* Retries with full-jitter exponential backoff on connection errors, 429
+  and 5xx, honouring Retry-After. Only idempotent methods are retried
+  unless the caller passes ``retries=``.
+* A per-host circuit breaker: after CIRCUIT_FAILURES failures in a row the
+  host is skipped for CIRCUIT_COOLDOWN seconds (calls raise CircuitOpen at
+  once), then a single trial call decides whether it closes again.
+* Per-host latency / error counters, see ``client.stats()``.
+
+Errors are ordinary ``requests`` exceptions (CircuitOpen is a
+RequestException too), so existing ``except requests.RequestException``
+blocks keep working.
+"""
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+LATENCY_SAMPLES = 200   # recent calls kept per host for percentiles
+
+
+class CircuitOpen(requests.RequestException):
+    """The host failed too often recently; the call was not attempted."""
+
+
+class _HostState:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.failures = 0          # consecutive
+        self.opened_at = None      # breaker open since (monotonic)
+        self.trial = False         # half-open call in flight
+
+    def snapshot(self):
+        lat = sorted(self.latencies)
+        pct = lambda p: round(lat[min(int(len(lat) * p), len(lat) - 1)] * 1000, 1) if lat else None
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'error_rate': round(self.errors / self.requests, 3) if self.requests else 0,
+            'p50_ms': pct(0.5),
+            'p95_ms': pct(0.95),
+            'max_ms': round(lat[-1] * 1000, 1) if lat else None,
+            'circuit': 'open' if self.opened_at is not None else 'closed',
+        }
+
+
+class HttpClient:
+    def __init__(self, timeout=(3.05, 10), retries=2, backoff=0.25, max_backoff=4,
+                 failures=5, cooldown=30, pool_size=16):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, retries=None, **kwargs):
+        method = method.upper()
+        host = urlsplit(url).netloc
+        if retries is None:
+            retries = self.retries if method in IDEMPOTENT else 0
+        kwargs.setdefault('timeout', self.timeout)
+
+        attempt = 0
+        while True:
+            self._admit(host)
+            response = None
+            ok = False
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+                ok = response.status_code not in RETRY_STATUSES
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries:
+                    raise
+            finally:
+                # Whatever happened (ChunkedEncodingError, InvalidURL, ...) is
+                # recorded, which also ends a half-open trial
+                self._record(host, time.monotonic() - start, ok=ok)
+            if response is not None:
+                if ok or attempt >= retries:
+                    return response
+                response.close()   # hand the connection back before waiting
+            attempt += 1
+            self._count_retry(host)
+            time.sleep(self._delay(attempt, response))
+
+    # ----------------- Backoff -----------------
+    def _delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), self.max_backoff)
+        # Full jitter: anywhere up to the exponential ceiling
+        return random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+
+    # ----------------- Circuit breaker + metrics -----------------
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts.setdefault(host, _HostState())
+        return state
+
+    def _admit(self, host):
+        with self._lock:
+            state = self._state(host)
+            if state.opened_at is None:
+                return
+            if time.monotonic() - state.opened_at >= self.cooldown and not state.trial:
+                state.trial = True   # half-open: let this one call through
+                return
+            state.rejected += 1
+        raise CircuitOpen(f"{host} is failing, not calling it for now")
+
+    def _record(self, host, elapsed, ok):
+        with self._lock:
+            state = self._state(host)
+            state.requests += 1
+            state.latencies.append(elapsed)
+            state.trial = False
+            if ok:
+                state.failures = 0
+                state.opened_at = None
+                return
+            state.errors += 1
+            state.failures += 1
+            if state.failures >= self.failure_threshold:
+                if state.opened_at is None:
+                    print(f"HTTP circuit for {host} opened after {state.failures} failures")
+                state.opened_at = time.monotonic()
+
+    def _count_retry(self, host):
+        with self._lock:
+            self._state(host).retries += 1
+
+    def stats(self):
+        """{host: {requests, errors, retries, rejected, error_rate, p50_ms, p95_ms, max_ms, circuit}}"""
+        with self._lock:
+            return {host: state.snapshot() for host, state in self._hosts.items()}
+
+
+client = HttpClient(
+    timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT),
+    retries=Config.HTTP_RETRIES,
+    failures=Config.HTTP_CIRCUIT_FAILURES,
+    cooldown=Config.HTTP_CIRCUIT_COOLDOWN,
+)
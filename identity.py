@@ -0,0 +1,61 @@
+# identity.py
+"""Per-process cache of the logged-in user's identity.
+
+Flask-Login calls the user loader on every request; without this that is
+a full ``SELECT * FROM user`` per page view. ``identities`` keeps just the
+columns auth and the page header need (see ``User.IDENTITY_COLUMNS``) for
+USER_CACHE_TTL seconds, and ``User.load_identity`` rebuilds a
+session-attached User from them without touching the database.
+
+Entries are dropped explicitly when this process changes them
+(``User.update_streak``); the short TTL bounds how stale another worker's
+write can look here.
+"""
+import threading
+import time
+
+from config import Config
+
+
+class IdentityCache:
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}   # user id -> (expires_at, {column: value})
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """The cached columns for ``user_id``, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, user_id, columns):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[user_id] = (now + self.ttl, dict(columns))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+identities = IdentityCache(ttl=Config.USER_CACHE_TTL)
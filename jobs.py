@@ -0,0 +1,142 @@
+# jobs.py
+"""Run slow work (LLM calls, deferred writes) off the request thread.
+
+``submit`` stores a GenerationJob row and hands the job to a small thread
+pool, so the view can return the job id straight away. The worker runs
+the registered handler inside an app context and writes the outcome back
+to the row; clients poll ``GET /gemini/jobs/<id>`` for it.
+
+The pool is in-process, so a restart or deploy drops whatever it held.
+Such rows would stay queued/running forever, so they are failed instead
+(``expire_stale`` at boot, and ``get`` when polled): a queued job once
+it has waited JOB_TIMEOUT since it was created, a running one once it has
+run JOB_TIMEOUT since it started (longer than the Gemini call timeout, so
+a live worker can't still be on it). Every status change is a conditional
+UPDATE from the state it expects, so an expired job is never picked up
+or finished afterwards, by this worker or another.
+"""
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from config import Config
+from models import db, GenerationJob
+
+_executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix='jobs')
+# Quick fire-and-forget DB writes get their own threads, so they never
+# queue behind 5-20 s generations on the pool above
+_writer = ThreadPoolExecutor(max_workers=Config.WRITE_WORKERS, thread_name_prefix='writes')
+
+# kind -> handler(payload, user_id) returning a JSON-serialisable result
+HANDLERS = {}
+
+UNFINISHED = ('queued', 'running')
+STALE_ERROR = 'This request was interrupted by a server restart, please try again.'
+
+
+def register(kind):
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def submit(kind, user_id, payload):
+    """Queue a job and return its id. Must be called inside an app context."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = GenerationJob(id=uuid.uuid4().hex, user_id=user_id, kind=kind, payload=json.dumps(payload))
+    db.session.add(job)
+    db.session.commit()
+    _executor.submit(_run, current_app._get_current_object(), job.id)
+    return job.id
+
+
+def run_in_background(fn, *args):
+    """Run ``fn(*args)`` on the write pool inside an app context, fire-and-forget.
+
+    For writes the response doesn't depend on; failures are only logged.
+    """
+    app = current_app._get_current_object()
+
+    def task():
+        with app.app_context():
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Background task {fn.__name__} failed: {e}")
+            finally:
+                db.session.remove()
+
+    return _writer.submit(task)
+
+
+def _stale():
+    """Filter for unfinished jobs nobody can still be working on"""
+    cutoff = datetime.utcnow() - timedelta(seconds=Config.JOB_TIMEOUT)
+    return db.or_(
+        db.and_(GenerationJob.status == 'queued', GenerationJob.created_at < cutoff),
+        db.and_(GenerationJob.status == 'running', GenerationJob.started_at < cutoff),
+    )
+
+
+def _transition(job_id, expected, **values):
+    """Move a job on only if it is still in ``expected``; False if it wasn't."""
+    count = GenerationJob.query.filter(
+        GenerationJob.id == job_id, GenerationJob.status.in_(expected),
+    ).update(values, synchronize_session=False)
+    db.session.commit()
+    return count == 1
+
+
+def expire_stale(job_id=None):
+    """Fail every unfinished job that is past its time (or just ``job_id``); returns how many."""
+    query = GenerationJob.query.filter(_stale())
+    if job_id is not None:
+        query = query.filter(GenerationJob.id == job_id)
+    count = query.update({'status': 'error', 'error': STALE_ERROR, 'finished_at': datetime.utcnow()},
+                         synchronize_session=False)
+    db.session.commit()
+    if count:
+        print(f"Marked {count} interrupted job(s) as failed")
+    return count
+
+
+def get(job_id, user_id):
+    """Return the job as a dict for its owner, or None."""
+    job = db.session.get(GenerationJob, job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    since = job.started_at if job.status == 'running' else job.created_at
+    if job.status in UNFINISHED and since and since < datetime.utcnow() - timedelta(seconds=Config.JOB_TIMEOUT):
+        expire_stale(job_id)
+        db.session.refresh(job)
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+    }
+
+
+def _run(app, job_id):
+    with app.app_context():
+        try:
+            if not _transition(job_id, ('queued',), status='running', started_at=datetime.utcnow()):
+                return   # expired while it waited in the queue
+            job = db.session.get(GenerationJob, job_id)
+            kind, payload, user_id = job.kind, json.loads(job.payload), job.user_id
+            try:
+                outcome = {'status': 'done', 'result': json.dumps(HANDLERS[kind](payload, user_id))}
+            except Exception as e:
+                db.session.rollback()
+                print(f"Job {job_id} ({kind}) failed: {e}")
+                outcome = {'status': 'error', 'error': str(e)}
+            if not _transition(job_id, ('running',), finished_at=datetime.utcnow(), **outcome):
+                print(f"Job {job_id} ({kind}) finished after it was given up on; result dropped")
+        finally:
+            db.session.remove()
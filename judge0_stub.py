@@ -0,0 +1,94 @@
+# judge0_stub.py
+"""Tiny local stand-in for the Judge0 submissions API.
+
+Speaks just enough of the protocol for code_runner.Judge0Backend: base64
+bodies, ``wait=true`` and polling by token. Python (language 71) is really run
+with the local interpreter; every other language gets a compilation
+error. Use it to exercise the code runner offline:
+
+    python judge0_stub.py            # listens on 127.0.0.1:2358
+    JUDGE0_URL=http://127.0.0.1:2358/submissions LOCAL_RUNNER_ENABLED=0 \
+        flask --app app:create_app run
+
+STUB_DELAY=3 makes every run take at least 3 seconds, so the pending /
+polling path can be tested too.
+"""
+import base64
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from flask import Flask, request, jsonify
+
+app = Flask(__name__)
+
+DELAY = float(os.getenv('STUB_DELAY', 0))
+WAIT_LIMIT = 5            # seconds a wait=true submission is held open
+PYTHON_ID = 71
+
+STATUSES = {
+    1: 'In Queue', 2: 'Processing', 3: 'Accepted',
+    5: 'Time Limit Exceeded', 6: 'Compilation Error', 11: 'Runtime Error (NZEC)',
+}
+
+submissions = {}
+lock = threading.Lock()
+
+
+def _b64(text):
+    return base64.b64encode(text.encode()).decode() if text else None
+
+
+def _execute(token, source, language_id):
+    time.sleep(DELAY)
+    result = {'stdout': None, 'stderr': None, 'compile_output': None}
+    if language_id != PYTHON_ID:
+        status = 6
+        result['compile_output'] = _b64(f"judge0_stub only runs Python (language {PYTHON_ID})\n")
+    else:
+        try:
+            proc = subprocess.run([sys.executable, '-c', source], capture_output=True, text=True, timeout=5)
+            status = 3 if proc.returncode == 0 else 11
+            result['stdout'] = _b64(proc.stdout)
+            result['stderr'] = _b64(proc.stderr)
+        except subprocess.TimeoutExpired:
+            status = 5
+    with lock:
+        submissions[token].update(result, status={'id': status, 'description': STATUSES[status]})
+
+
+@app.route('/submissions', methods=['POST'])
+def create():
+    data = request.json
+    source = data.get('source_code') or ''
+    if request.args.get('base64_encoded') == 'true':
+        source = base64.b64decode(source).decode()
+
+    token = uuid.uuid4().hex
+    with lock:
+        submissions[token] = {'token': token, 'status': {'id': 1, 'description': STATUSES[1]}}
+    worker = threading.Thread(target=_execute, args=(token, source, data.get('language_id')), daemon=True)
+    worker.start()
+
+    if request.args.get('wait') == 'true':
+        worker.join(WAIT_LIMIT)
+        if not worker.is_alive():
+            with lock:
+                return jsonify(submissions[token]), 201
+    return jsonify({'token': token}), 201
+
+
+@app.route('/submissions/<token>')
+def show(token):
+    with lock:
+        sub = submissions.get(token)
+        if sub is None:
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify(sub)
+
+
+if __name__ == '__main__':
+    app.run(port=int(os.getenv('STUB_PORT', 2358)), threaded=True)
@@ -0,0 +1,228 @@
+# media.py
+"""Post-upload processing for SkillShare videos.
+
+Uploads are stored as whatever the user sent (MP4, MOV, AVI). ``submit``
+queues the post on a small local pool that, with PyAV:
+
+  * transcodes to H.264/AAC MP4 with ``+faststart`` (moov atom first, so
+    playback starts before the download ends) and a bitrate/height cap,
+    or just remuxes when the source is already H.264 within the caps;
+  * grabs a poster frame as a JPEG next to the video;
+  * records the duration.
+
+SkillPost.status goes processing -> ready (or failed, keeping the
+original file). Only a post still 'processing' can move on, so two runs
+over the same post (a live worker and ``flask process-videos``) can't
+overwrite each other's outcome. The pool is in-process: posts left
+processing by a restart are failed at boot once TRANSCODE_TIMEOUT has
+passed (``expire_stale``), which shows them as uploaded. Encoding is CPU
+bound, so keep TRANSCODE_WORKERS small.
+"""
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from fractions import Fraction
+
+from flask import current_app
+
+from config import Config
+from models import db, SkillPost
+
+try:
+    import av
+except ImportError:   # processing is skipped; posts are marked ready as uploaded
+    av = None
+
+_executor = ThreadPoolExecutor(max_workers=Config.TRANSCODE_WORKERS, thread_name_prefix='transcode')
+
+POSTER_WIDTH = 640
+AUDIO_BITRATE = 128_000
+DURATION_TOLERANCE = 1.0   # seconds the output may differ from the source
+
+
+def submit(post_id):
+    """Queue a freshly created post for processing. Call inside an app context."""
+    app = current_app._get_current_object()
+
+    def task():
+        with app.app_context():
+            try:
+                process(post_id)
+            finally:
+                db.session.remove()
+
+    return _executor.submit(task)
+
+
+def _finish(post_id, **values):
+    """Record the outcome if the post is still processing; False if another run got there first"""
+    count = SkillPost.query.filter_by(id=post_id, status='processing').update(values, synchronize_session=False)
+    db.session.commit()
+    return count == 1
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def process(post_id):
+    post = db.session.get(SkillPost, post_id)
+    if post is None or post.status != 'processing':
+        return
+    folder = current_app.config['UPLOAD_FOLDER']
+    if av is None:
+        _finish(post_id, status='ready')
+        return
+
+    old = post.video_filename
+    src = os.path.join(folder, old)
+    stem = uuid.uuid4().hex
+    dst = os.path.join(folder, f"{stem}.mp4")
+    tmp = dst + '.tmp'
+    poster = os.path.join(folder, f"{stem}.jpg")
+    try:
+        with av.open(src) as probe:
+            duration = probe.duration / av.time_base if probe.duration else None
+            needs_encode = _needs_encode(probe)
+        (transcode if needs_encode else remux)(src, tmp)
+        _check_duration(tmp, duration)
+        os.replace(tmp, dst)
+        _write_poster(dst, poster, duration)
+    except Exception as e:
+        print(f"Processing video for post {post_id} failed: {e}")
+        _remove(tmp, dst, poster)
+        _finish(post_id, status='failed')
+        return
+
+    if not _finish(post_id, video_filename=f"{stem}.mp4", poster_filename=f"{stem}.jpg",
+                   duration=duration, status='ready'):
+        _remove(dst, poster)
+        print(f"Post {post_id} was already processed elsewhere; dropped this copy")
+        return
+    os.remove(src)
+    print(f"Processed video for post {post_id} ({'transcoded' if needs_encode else 'remuxed'} {old})")
+
+
+def _scaled_size(width, height):
+    """Fit under TRANSCODE_MAX_HEIGHT, keeping the aspect ratio and even sides (yuv420p)"""
+    if height > Config.TRANSCODE_MAX_HEIGHT:
+        width, height = width * Config.TRANSCODE_MAX_HEIGHT // height, Config.TRANSCODE_MAX_HEIGHT
+    return width - width % 2, height - height % 2
+
+
+def _needs_encode(container):
+    if not container.streams.video:
+        raise ValueError('no video stream')
+    video = container.streams.video[0]
+    audio = container.streams.audio[0] if container.streams.audio else None
+    return not (
+        video.codec_context.name == 'h264'
+        and video.codec_context.height <= Config.TRANSCODE_MAX_HEIGHT
+        and (video.bit_rate or container.bit_rate or 0) <= Config.TRANSCODE_MAX_BITRATE
+        and (audio is None or audio.codec_context.name == 'aac')
+    )
+
+
+def remux(src, dst):
+    """Copy the streams into a faststart MP4 without re-encoding."""
+    with av.open(src) as inp, av.open(dst, 'w', format='mp4', options={'movflags': '+faststart'}) as out:
+        streams = [inp.streams.video[0], *inp.streams.audio[:1]]
+        mapping = {s.index: out.add_stream_from_template(s) for s in streams}
+        for packet in inp.demux(streams):
+            if packet.dts is None:   # demuxer flush packet
+                continue
+            packet.stream = mapping[packet.stream.index]
+            out.mux(packet)
+
+
+def transcode(src, dst):
+    """Re-encode to H.264 (capped bitrate and height) + AAC in a faststart MP4."""
+    with av.open(src) as inp, av.open(dst, 'w', format='mp4', options={'movflags': '+faststart'}) as out:
+        vin = inp.streams.video[0]
+        ain = inp.streams.audio[0] if inp.streams.audio else None
+        vin.thread_type = 'AUTO'
+
+        width, height = _scaled_size(vin.codec_context.width, vin.codec_context.height)
+        vout = out.add_stream('libx264', rate=vin.average_rate or Fraction(30))
+        vout.width, vout.height, vout.pix_fmt = width, height, 'yuv420p'
+        bitrate = Config.TRANSCODE_MAX_BITRATE
+        vout.options = {'preset': 'veryfast', 'crf': '23',
+                        'maxrate': str(bitrate), 'bufsize': str(bitrate * 2)}
+        aout = None
+        if ain is not None:
+            rate = ain.codec_context.sample_rate or 44100
+            aout = out.add_stream('aac', rate=rate)
+            aout.bit_rate = AUDIO_BITRATE
+            # Re-chunk to AAC's frame size with our own sample-count pts; source
+            # timestamps (e.g. 1152-sample MP3 frames in AVI) don't line up with it.
+            # The chunks keep the source time base (32/1225 for MP3 in AVI), so
+            # say the pts are in samples or the audio comes out ~1000x too long.
+            resampler = av.AudioResampler(format='fltp', layout=aout.layout, rate=rate,
+                                          frame_size=aout.codec_context.frame_size)
+            audio_tb = Fraction(1, rate)
+            samples = 0
+
+        for packet in inp.demux([s for s in (vin, ain) if s is not None]):
+            for frame in packet.decode():
+                if packet.stream is vin:
+                    frame = frame.reformat(width=width, height=height, format='yuv420p')
+                    out.mux(vout.encode(frame))
+                else:
+                    for chunk in resampler.resample(frame):
+                        chunk.pts, samples = samples, samples + chunk.samples
+                        chunk.time_base = audio_tb
+                        out.mux(aout.encode(chunk))
+        out.mux(vout.encode(None))
+        if aout is not None:
+            for chunk in resampler.resample(None):
+                chunk.pts, samples = samples, samples + chunk.samples
+                chunk.time_base = audio_tb
+                out.mux(aout.encode(chunk))
+            out.mux(aout.encode(None))
+
+
+def _check_duration(path, expected):
+    """Refuse output whose streams don't last about as long as the source did"""
+    if not expected:
+        return
+    with av.open(path) as container:
+        for stream in container.streams:
+            if not stream.duration:
+                continue
+            length = float(stream.duration * stream.time_base)
+            if abs(length - expected) > max(DURATION_TOLERANCE, expected * 0.05):
+                raise ValueError(f"{stream.type} stream lasts {length:.1f}s, source {expected:.1f}s")
+
+
+def _write_poster(video_path, poster_path, duration):
+    """Save a frame ~10% in (at most 3s) as a JPEG, scaled to POSTER_WIDTH"""
+    at = min(duration * 0.1, 3.0) if duration else 0
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        if at:
+            container.seek(int(at * av.time_base))
+        for frame in container.decode(stream):
+            image = frame.to_image()
+            image.thumbnail((POSTER_WIDTH, POSTER_WIDTH))
+            image.save(poster_path, 'JPEG', quality=80)
+            return
+    raise ValueError('no frames to take a poster from')
+
+
+def expire_stale():
+    """Fail posts processing for longer than TRANSCODE_TIMEOUT (lost to a restart); returns how many."""
+    cutoff = datetime.utcnow() - timedelta(seconds=Config.TRANSCODE_TIMEOUT)
+    stuck = SkillPost.query.filter(SkillPost.status == 'processing', SkillPost.created_at < cutoff)
+    count = stuck.update({'status': 'failed'}, synchronize_session=False)
+    db.session.commit()
+    if count:
+        print(f"Marked {count} interrupted video(s) as failed; they are served as uploaded")
+    return count
+
+
+def pending():
+    """Posts still waiting for processing (e.g. the process stopped mid-queue)."""
+    return [p.id for p in SkillPost.query.filter_by(status='processing').with_entities(SkillPost.id)]
@@ -1,9 +1,43 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import deferred, load_only, make_transient_to_detached, validates
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import date, datetime, timedelta
+import json
+import re
+
+from identity import identities
 
 db = SQLAlchemy()
 
+def configure_db(app):
+    """Bind db to the app and tune SQLite connections as they are opened.
+
+    WAL lets readers carry on while one gunicorn worker writes, NORMAL sync
+    is durable enough under WAL, and busy_timeout makes a blocked writer
+    wait instead of failing with "database is locked".
+    """
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return
+
+        @event.listens_for(db.engine, 'connect')
+        def sqlite_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            cur.execute('PRAGMA journal_mode=WAL')
+            cur.execute('PRAGMA synchronous=NORMAL')
+            cur.execute(f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}")
+            cur.execute(f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}")
+            cur.execute(f"PRAGMA cache_size=-{int(app.config['SQLITE_CACHE_KB'])}")
+            cur.close()
+
+def insert_for(model):
+    """INSERT for ``model`` that supports .on_conflict_do_*() on SQLite and Postgres"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(model)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(150), unique=True, nullable=False)
@@ -11,10 +45,32 @@ class User(UserMixin, db.Model):
     name = db.Column(db.String(100))
     streak = db.Column(db.Integer, default=0)
     last_active = db.Column(db.Date)
-    learned = db.Column(db.Text, default='')  # topic|mode|difficulty
+    learned = deferred(db.Column(db.Text, default=''))  # legacy topic|mode|difficulty list, see LearningEvent
+
+    # What the user loader keeps in the identity cache: auth + page header
+    IDENTITY_COLUMNS = ('id', 'email', 'name', 'streak', 'last_active')
+
+    @classmethod
+    def load_identity(cls, user_id):
+        """The user for ``user_id`` for this request: no query on a cache hit,
+        one narrow SELECT otherwise. Other columns load lazily if touched."""
+        cols = identities.get(user_id)
+        if cols is None:
+            user = db.session.get(cls, user_id, options=[load_only(*(getattr(cls, c) for c in cls.IDENTITY_COLUMNS))])
+            if user is not None:
+                identities.put(user_id, {c: getattr(user, c) for c in cls.IDENTITY_COLUMNS})
+            return user
+        user = cls(**cols)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
 
     def update_streak(self):
         today = date.today()
+        if self.last_active == today:
+            return
+        # Our copy may come from the identity cache; another worker could
+        # already have counted today, so decide on the row itself
+        db.session.refresh(self, ['streak', 'last_active'])
         if self.last_active == today:
             return
         if self.last_active == today - timedelta(days=1):
@@ -23,14 +79,60 @@ class User(UserMixin, db.Model):
             self.streak = 1
         self.last_active = today
         db.session.commit()
+        identities.invalidate(self.id)
 
     def log_learning(self, topic, mode, difficulty=None):
-        entry = f"{topic}|{mode}|{difficulty or ''}"
-        parts = [p.strip() for p in self.learned.split(',') if p.strip()]
-        if entry not in parts:
-            parts.append(entry)
-            self.learned = ','.join(parts)
+        db.session.add(LearningEvent(user_id=self.id, topic=topic, mode=mode, difficulty=difficulty))
         self.update_streak()
+        db.session.commit()
+        identities.invalidate(self.id)
+
+class LearningEvent(db.Model):
+    """One docs/video/quiz session - replaces the comma-joined User.learned"""
+    __tablename__ = 'learning_event'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    topic = db.Column(db.String(200), nullable=False)
+    mode = db.Column(db.String(20), nullable=False)        # docs | video | ...
+    difficulty = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_learning_event_user_topic_mode', 'user_id', 'topic', 'mode'),
+        db.Index('ix_learning_event_user_recent', 'user_id', 'id'),     # newest-first history pages
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'topic': self.topic,
+            'mode': self.mode,
+            'difficulty': self.difficulty,
+            'created_at': self.created_at.isoformat(),
+        }
+
+def backfill_learning_events():
+    """Turn every legacy User.learned string into LearningEvent rows.
+
+    The string is cleared afterwards, so running this twice is harmless.
+    Old entries have no timestamp; they get the user's last active day.
+    Returns the number of events created.
+    """
+    created = 0
+    users = User.query.filter(User.learned.isnot(None), User.learned != '').all()
+    for user in users:
+        when = datetime.combine(user.last_active, datetime.min.time()) if user.last_active else datetime.utcnow()
+        for entry in user.learned.split(','):
+            parts = entry.strip().split('|')
+            if not parts[0]:
+                continue
+            topic, mode, difficulty = (parts + ['', ''])[:3]
+            db.session.add(LearningEvent(user_id=user.id, topic=topic, mode=mode or 'unknown',
+                                         difficulty=difficulty or None, created_at=when))
+            created += 1
+        user.learned = ''
+    db.session.commit()
+    return created
 
 class PlaylistItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -43,13 +145,37 @@ class PlaylistItem(db.Model):
     channel = db.Column(db.String(200))
     searched_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # One row per saved video per user; repeat searches refresh it (upsert)
+        db.Index('uq_playlist_item_user_url', 'user_id', 'url', unique=True),
+        # Dashboard: a user's most recent saves
+        db.Index('ix_playlist_item_user_recent', 'user_id', searched_at.desc()),
+    )
+
+def make_preview(markdown, length=280):
+    """Plain-text opening of a Markdown document, for lists that shouldn't load the body"""
+    text = re.sub(r'```.*?(```|$)', ' ', markdown, flags=re.S)          # code blocks
+    text = re.sub(r'!?\[([^\]]*)\]\([^)]*\)', r'\1', text)                 # links / images
+    text = re.sub(r'^\s{0,3}(#{1,6}|[-*+>]|\d+\.)\s*', '', text, flags=re.M)  # headings, bullets, quotes
+    text = re.sub(r'[*_`~]', '', text)
+    text = ' '.join(text.split())
+    return text if len(text) <= length else text[:length].rsplit(' ', 1)[0] + '…'
+
 class Documentation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     topic = db.Column(db.String(200), nullable=False)
     markdown = db.Column(db.Text, nullable=False)
+    preview = db.Column(db.String(300))        # make_preview(markdown), kept in step below
     generated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_documentation_user_recent', 'user_id', generated_at.desc()),)
+
+    @validates('markdown')
+    def _set_preview(self, key, markdown):
+        self.preview = make_preview(markdown or '')
+        return markdown
+
 class SkillPost(db.Model):
     __tablename__ = 'skill_post'
     id = db.Column(db.Integer, primary_key=True)
@@ -58,11 +184,20 @@ class SkillPost(db.Model):
     video_filename = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Denormalised count of Like rows, kept in step by routes.skillshare.set_like
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Set by media.process: processing -> ready | failed
+    status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')
+    poster_filename = db.Column(db.String(200))
+    duration = db.Column(db.Float)                   # seconds
 
     author = db.relationship('User', backref='skill_posts')
     likes = db.relationship('Like', backref='post',
                             lazy=True, cascade='all, delete-orphan')
 
+    # Feed order + keyset cursor: (created_at, id) descending
+    __table_args__ = (db.Index('ix_skill_post_created_id', 'created_at', 'id'),)
+
 
 class Like(db.Model):
     __tablename__ = 'like'
@@ -70,4 +205,75 @@ class Like(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('skill_post.id'), nullable=False)
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='uq_user_post'),)
\ No newline at end of file
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='uq_user_post'),
+        db.Index('ix_like_post', 'post_id'),   # per-post like counts
+    )
+
+class QuizAttempt(db.Model):
+    """One generated quiz as served to a user, and how they did on it."""
+    __tablename__ = 'quiz_attempt'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    topic = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    submitted_at = db.Column(db.DateTime)
+    score = db.Column(db.Integer)
+
+    questions = db.relationship('QuizQuestion', backref='attempt', lazy=True,
+                                order_by='QuizQuestion.position', cascade='all, delete-orphan')
+
+    __table_args__ = (db.Index('ix_quiz_attempt_user_recent', 'user_id', 'id'),)
+
+    def to_dict(self):
+        """What the quiz page needs - no correct answers"""
+        return {
+            'quiz_id': self.id,
+            'topic': self.topic,
+            'questions': [{'id': q.id, 'question': q.question, 'options': json.loads(q.options)}
+                          for q in self.questions],
+        }
+
+
+class QuizQuestion(db.Model):
+    __tablename__ = 'quiz_question'
+    id = db.Column(db.Integer, primary_key=True)
+    attempt_id = db.Column(db.Integer, db.ForeignKey('quiz_attempt.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    question = db.Column(db.Text, nullable=False)
+    options = db.Column(db.Text, nullable=False)      # JSON list
+    correct = db.Column(db.String(1), nullable=False)
+    answer = db.Column(db.String(1))                  # set on submit; NULL = skipped
+    is_correct = db.Column(db.Boolean)
+
+    __table_args__ = (db.Index('ix_quiz_question_attempt', 'attempt_id', 'position'),)
+
+
+class GenerationJob(db.Model):
+    """A background Gemini request (see jobs.py)."""
+    __tablename__ = 'generation_job'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)          # docs | quiz
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued | running | done | error
+    payload = db.Column(db.Text, nullable=False)             # JSON
+    result = db.Column(db.Text)                              # JSON
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class UploadSession(db.Model):
+    """A resumable SkillShare video upload in progress (see uploads.py)."""
+    __tablename__ = 'upload_session'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    extension = db.Column(db.String(10), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)             # declared total, bytes
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # bytes safely on disk
+    sha256 = db.Column(db.String(64))                            # optional whole-file digest
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
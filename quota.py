@@ -0,0 +1,164 @@
+# quota.py
+"""Daily budget governor for the YouTube Data API quota.
+
+The API key gets a fixed number of units per quota day (search.list costs
+100, videos.list and commentThreads.list 1 each), and Google resets the
+count at midnight Pacific time - it does not refill continuously. So the
+governor keeps the same books: units spent per Pacific day, with ``spend``
+refusing a call once it would take the day past ``daily_units``. The
+counters live in the cache's SQLite file, so every worker process draws
+from the same budget.
+
+As the day's budget drains, searches degrade instead of failing outright:
+once less than ``comments_floor`` of it is left comments are no longer
+fetched, and below ``transcripts_floor`` transcripts aren't either (cached
+copies of both are still used). Only when a search itself can't be paid
+for does it come back empty.
+
+Our count can drift from Google's (other users of the key, restarts mid
+call), so a 403 ``quotaExceeded`` body passed to ``observe`` marks the day
+as spent, whatever the counter says.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from config import Config
+
+COSTS = {'search': 100, 'videos': 1, 'commentThreads': 1}
+QUOTA_TZ = ZoneInfo('America/Los_Angeles')   # where the YouTube quota day starts and ends
+
+
+def quota_day():
+    return datetime.now(QUOTA_TZ).date().isoformat()
+
+
+class QuotaGovernor:
+    def __init__(self, path, daily_units=10000, comments_floor=0.3, transcripts_floor=0.1):
+        self.path = str(path)
+        self.capacity = daily_units
+        self.floors = {'comments': comments_floor, 'transcripts': transcripts_floor}
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quota_day (
+                    day       TEXT PRIMARY KEY,
+                    units     INTEGER NOT NULL DEFAULT 0,
+                    exhausted INTEGER NOT NULL DEFAULT 0
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quota_usage (
+                    day      TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    units    INTEGER NOT NULL DEFAULT 0,
+                    calls    INTEGER NOT NULL DEFAULT 0,
+                    denied   INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, endpoint)
+                )""")
+            self._local.conn = conn
+        return conn
+
+    def _spent(self, conn, day):
+        """Units used so far on ``day``; the whole budget once Google said it's gone"""
+        row = conn.execute('SELECT units, exhausted FROM quota_day WHERE day = ?', (day,)).fetchone()
+        if row is None:
+            return 0
+        units, exhausted = row
+        return self.capacity if exhausted else units
+
+    # ----------------- Public API -----------------
+    def spend(self, endpoint, units=None):
+        """Count the units for one call against today; False means don't make it."""
+        units = COSTS[endpoint] if units is None else units
+        day = quota_day()
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')   # one writer at a time across processes
+            try:
+                left = self.capacity - self._spent(conn, day)
+                allowed = left >= units
+                if allowed:
+                    conn.execute("""
+                        INSERT INTO quota_day (day, units) VALUES (?, ?)
+                        ON CONFLICT (day) DO UPDATE SET units = units + excluded.units""",
+                        (day, units))
+                    left -= units
+                conn.execute("""
+                    INSERT INTO quota_usage (day, endpoint, units, calls, denied) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (day, endpoint) DO UPDATE SET
+                        units = units + excluded.units,
+                        calls = calls + excluded.calls,
+                        denied = denied + excluded.denied""",
+                    (day, endpoint, units if allowed else 0, int(allowed), int(not allowed)))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            # Bookkeeping trouble shouldn't take search down with it
+            print("Quota governor error:", e)
+            return True
+        if not allowed:
+            print(f"YouTube quota low: skipped {endpoint} ({left} units left today)")
+        return allowed
+
+    def observe(self, body):
+        """Look at an API response body; a quotaExceeded error empties today's budget."""
+        error = body.get('error') if isinstance(body, dict) else None
+        reasons = {e.get('reason') for e in (error or {}).get('errors', [])}
+        if not reasons & {'quotaExceeded', 'dailyLimitExceeded'}:
+            return False
+        try:
+            self._conn().execute("""
+                INSERT INTO quota_day (day, exhausted) VALUES (?, 1)
+                ON CONFLICT (day) DO UPDATE SET exhausted = 1""", (quota_day(),))
+        except sqlite3.Error as e:
+            print("Quota governor error:", e)
+        print("YouTube reports the daily quota as exceeded; holding off until midnight Pacific")
+        return True
+
+    def remaining(self):
+        try:
+            return self.capacity - self._spent(self._conn(), quota_day())
+        except sqlite3.Error as e:
+            print("Quota governor error:", e)
+            return self.capacity
+
+    def allows(self, feature):
+        """Whether optional lookups ('comments', 'transcripts') are still worth the budget."""
+        return self.remaining() >= self.capacity * self.floors[feature]
+
+    def usage(self):
+        """Today's budget, current degradation and per-endpoint counters."""
+        day = quota_day()
+        remaining = self.remaining()
+        try:
+            rows = self._conn().execute(
+                'SELECT endpoint, units, calls, denied FROM quota_usage WHERE day = ?', (day,)).fetchall()
+        except sqlite3.Error:
+            rows = []
+        return {
+            'day': day,
+            'capacity': self.capacity,
+            'remaining': remaining,
+            'comments': remaining >= self.capacity * self.floors['comments'],
+            'transcripts': remaining >= self.capacity * self.floors['transcripts'],
+            'today': {endpoint: {'units': units, 'calls': calls, 'denied': denied}
+                      for endpoint, units, calls, denied in rows},
+        }
+
+
+quota = QuotaGovernor(
+    Config.CACHE_DB_PATH,
+    daily_units=Config.YOUTUBE_DAILY_QUOTA,
+    comments_floor=Config.QUOTA_COMMENTS_FLOOR,
+    transcripts_floor=Config.QUOTA_TRANSCRIPTS_FLOOR,
+)
@@ -0,0 +1,106 @@
+# ranking.py
+"""Smart-score ranking for YouTube search candidates.
+
+A candidate is a ``(video, stats, comments, transcript_score)`` tuple as
+returned by ``routes.youtube.enrich_candidates``; ``comments`` and
+``transcript_score`` may be None when enrichment ran out of time. ``rank``
+turns a batch into NumPy columns, lets every registered feature turn those
+into a 0-1 score per candidate, weights them for the difficulty level in
+one matrix-vector product and picks the top k with a stable sort.
+
+Nothing here touches Flask or the network, so cached candidate pools can be
+re-ranked offline (different weights, a new feature) for the cost of the
+arithmetic.
+"""
+import numpy as np
+
+# name -> extractor(columns) returning a float array of 0-1 values, one per candidate
+FEATURES = {}
+
+# Per-level weights; each set sums to 1 so scores stay on a 0-100 scale.
+# 'medium' is the original fixed blend.
+WEIGHTS = {
+    'basic':  {'transcript': 0.40, 'like_ratio': 0.25, 'watch_hours': 0.20, 'comments': 0.15},
+    'medium': {'transcript': 0.50, 'like_ratio': 0.20, 'watch_hours': 0.15, 'comments': 0.15},
+    'hard':   {'transcript': 0.60, 'like_ratio': 0.15, 'watch_hours': 0.10, 'comments': 0.15},
+}
+DEFAULT_LEVEL = 'medium'
+
+
+def feature(name):
+    """Register an extractor under ``name`` (give it a weight in WEIGHTS to use it)."""
+    def decorator(fn):
+        FEATURES[name] = fn
+        return fn
+    return decorator
+
+
+def columns(candidates):
+    """Candidate tuples -> dict of equal-length float arrays"""
+    n = len(candidates)
+    cols = {name: np.zeros(n) for name in ('views', 'likes', 'comments', 'duration', 'positive', 'transcript')}
+    for i, (_, info, comments, transcript_score) in enumerate(candidates):
+        cols['views'][i] = info['views']
+        cols['likes'][i] = info['likes']
+        cols['comments'][i] = info['comments']
+        cols['duration'][i] = info['duration']
+        cols['positive'][i] = len(comments or ())
+        cols['transcript'][i] = transcript_score or 0
+    return cols
+
+
+def _ratio(num, den):
+    out = np.zeros_like(num)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+# ----------------- Features -----------------
+@feature('transcript')
+def transcript_feature(cols):
+    return cols['transcript']
+
+
+@feature('like_ratio')
+def like_ratio_feature(cols):
+    return np.minimum(_ratio(cols['likes'], cols['views']), 1)
+
+
+@feature('watch_hours')
+def watch_hours_feature(cols):
+    # views * minutes / 60, saturating at 1000 hours
+    return np.minimum(cols['views'] * cols['duration'] / 60 / 1000, 1)
+
+
+@feature('comments')
+def comments_feature(cols):
+    return _ratio(cols['positive'], cols['comments'])
+
+
+# ----------------- Scoring -----------------
+def score(cols, level=DEFAULT_LEVEL):
+    """0-100 smart score for every candidate in ``cols``"""
+    weights = WEIGHTS.get(level, WEIGHTS[DEFAULT_LEVEL])
+    names = list(weights)
+    matrix = np.column_stack([FEATURES[name](cols) for name in names])
+    return matrix @ np.array([weights[name] for name in names]) * 100
+
+
+def top_k(scores, k):
+    """Indices of the k best scores, best first (ties keep input order).
+
+    A full stable sort rather than argpartition: which of several tied
+    scores survive an argpartition cut is arbitrary, and a search page is
+    only ~30 candidates anyway.
+    """
+    if k is not None and k <= 0:
+        return np.array([], dtype=int)
+    return np.argsort(-scores, kind='stable')[:k]
+
+
+def rank(candidates, level=DEFAULT_LEVEL, k=None):
+    """[(candidate, score), ...] for the top k candidates, best first"""
+    if not candidates:
+        return []
+    scores = score(columns(candidates), level)
+    return [(candidates[i], float(scores[i])) for i in top_k(scores, k)]
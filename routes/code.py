@@ -1,44 +1,47 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
-import requests, base64, time
+import requests
+from code_runner import backend_for, judge0
 from models import db
 
 bp = Blueprint('code', __name__)
 
-JUDGE0_URL = "https://ce.judge0.com/submissions"
-
 @bp.route('/code')
 @login_required
 def code_page():
     return render_template('code.html')
 
+def _respond(result):
+    if result['status'] == 'pending':
+        return jsonify(result), 202
+    current_user.update_streak()
+    db.session.commit()
+    return jsonify(result)
+
 @bp.route('/run', methods=['POST'])
 @login_required
 def run():
+    """Run code on the backend for its language; slow Judge0 runs come back as a token to poll"""
     data = request.json
     code = data['code']
     lang = data.get('lang', 'python')
 
-    lang_map = {'python': 71, 'javascript': 63, 'java': 62, 'c': 50, 'cpp': 54}
-    lang_id = lang_map.get(lang, 71)
-
-    payload = {
-        "source_code": base64.b64encode(code.encode()).decode(),
-        "language_id": lang_id,
-        "stdin": ""
-    }
+    try:
+        result = backend_for(lang).run(code, lang)
+    except (requests.RequestException, ValueError, RuntimeError, OSError) as e:
+        print("Code runner error:", e)
+        return jsonify({'error': 'Code runner unavailable, try again.'}), 502
+    return _respond(result)
 
-    r = requests.post(f"{JUDGE0_URL}?base64_encoded=true&fields=*", json=payload, timeout=10)
-    token = r.json()['token']
-
-    for _ in range(15):
-        time.sleep(1)
-        res = requests.get(f"{JUDGE0_URL}/{token}?base64_encoded=true&fields=*")
-        data = res.json()
-        if data['status']['id'] in (3, 4):
-            output = base64.b64decode(data['stdout'] or '').decode() if data['stdout'] else ''
-            error = base64.b64decode(data['stderr'] or '').decode() if data['stderr'] else ''
-            current_user.update_streak()
-            db.session.commit()
-            return jsonify({'output': output, 'error': error})
-    return jsonify({'error': 'Timeout'})
\ No newline at end of file
+@bp.route('/status/<token>')
+@login_required
+def status(token):
+    """One look at a pending Judge0 run - the browser does the waiting between calls"""
+    try:
+        result = judge0.status(token)
+    except (requests.RequestException, ValueError) as e:
+        print("Judge0 status error:", e)
+        return jsonify({'error': 'Code runner unavailable, try again.'}), 502
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 404
+    return _respond(result)
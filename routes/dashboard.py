@@ -1,18 +1,69 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
-from models import PlaylistItem, Documentation
+from sqlalchemy.orm import load_only
+from models import PlaylistItem, Documentation, LearningEvent
+from cache import cache, MISSING
+from http_client import client
 
 bp = Blueprint('dashboard', __name__)
 
-@bp.route('/dashboard')
-@login_required
-def index():
-    recent_playlists = PlaylistItem.query.filter_by(user_id=current_user.id)\
+# Rendered "saved courses + docs" HTML per user. Writers call
+# invalidate_activity, so the TTL only bounds how long an orphan lingers.
+ACTIVITY_TTL = 3600
+
+def invalidate_activity(user_id):
+    cache.delete('dashboard', str(user_id))
+
+def activity_html(user_id):
+    html = cache.get('dashboard', str(user_id))
+    if html is not MISSING:
+        return html
+
+    # Both lists walk their (user_id, timestamp DESC) index and stop at the
+    # limit; docs skip the markdown body and use the stored preview
+    recent_playlists = PlaylistItem.query.filter_by(user_id=user_id)\
+        .options(load_only(PlaylistItem.title, PlaylistItem.url, PlaylistItem.thumbnail,
+                           PlaylistItem.topic, PlaylistItem.difficulty))\
         .order_by(PlaylistItem.searched_at.desc()).limit(6).all()
-    recent_docs = Documentation.query.filter_by(user_id=current_user.id)\
+    recent_docs = Documentation.query.filter_by(user_id=user_id)\
+        .options(load_only(Documentation.topic, Documentation.preview))\
         .order_by(Documentation.generated_at.desc()).limit(5).all()
 
+    html = render_template('dashboard_activity.html',
+                           recent_playlists=recent_playlists,
+                           recent_docs=recent_docs)
+    cache.set('dashboard', str(user_id), html, ACTIVITY_TTL)
+    return html
+
+@bp.route('/dashboard')
+@login_required
+def index():
     return render_template('dashboard.html',
                            user=current_user,
-                           recent_playlists=recent_playlists,
-                           recent_docs=recent_docs)
\ No newline at end of file
+                           activity=activity_html(current_user.id))
+
+@bp.route('/history')
+@login_required
+def history():
+    """Newest-first learning events, optionally filtered by ?topic= and ?mode=.
+
+    Pages with ?before=<id of the last event seen>.
+    """
+    query = LearningEvent.query.filter_by(user_id=current_user.id)
+    if request.args.get('topic'):
+        query = query.filter_by(topic=request.args['topic'])
+    if request.args.get('mode'):
+        query = query.filter_by(mode=request.args['mode'])
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(LearningEvent.id < before)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))   # LIMIT -1 would mean no limit
+
+    events = query.order_by(LearningEvent.id.desc()).limit(limit).all()
+    return jsonify([e.to_dict() for e in events])
+
+@bp.route('/http-stats')
+@login_required
+def http_stats():
+    """Per-host latency, error and circuit-breaker numbers for outbound calls in this process"""
+    return jsonify(client.stats())
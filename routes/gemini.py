@@ -1,13 +1,29 @@
-from flask import Blueprint, render_template, request, jsonify, session
+from flask import Blueprint, render_template, request, jsonify, session, Response, stream_with_context
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
-import json, os
+import json, os, re, hashlib, random
+from datetime import datetime
 from flask_login import login_required, current_user
-from models import db, Documentation
+from models import db, Documentation, User, QuizAttempt, QuizQuestion
+import jobs
+from routes.dashboard import invalidate_activity
+from cache import SQLiteCache, MISSING
+from config import Config
 
 bp = Blueprint('gemini', __name__)
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 
+MODEL_NAME = 'gemini-2.5-flash'
+DOCS_PROMPT = """Write a concise learning document for "{topic}" in Markdown.
+Include: definition, key points, one code example, common pitfalls. Under 800 words."""
+QUIZ_PROMPT = "Generate {num} multiple-choice questions on the topic: '{topic}'."
+
+# Generated content is cached in its own store so LLM output isn't pushed
+# out by the much chattier YouTube cache
+generation_cache = SQLiteCache(Config.GEN_CACHE_DB_PATH, Config.GEN_CACHE_MAX_ENTRIES)
+QUIZ_POOL_MAX = 50      # questions kept per topic
+QUIZ_POOL_BATCH = 10    # ask for at least this many when topping the pool up
+
 # Define the structured output schema for the quiz
 QUIZ_SCHEMA = {
     "type": "array",
@@ -31,6 +47,137 @@ QUIZ_SCHEMA = {
 def docs_page():
     return render_template('docs.html')
 
+# ----------------- Generation -----------------
+def write_docs(topic):
+    model = genai.GenerativeModel(MODEL_NAME)
+    resp = model.generate_content(DOCS_PROMPT.format(topic=topic),
+                                  request_options={'timeout': Config.GEMINI_TIMEOUT})
+    return resp.text.strip()
+
+def stream_docs(topic):
+    """Yield the document as Gemini produces it"""
+    model = genai.GenerativeModel(MODEL_NAME)
+    for chunk in model.generate_content(DOCS_PROMPT.format(topic=topic), stream=True):
+        if chunk.text:
+            yield chunk.text
+
+def write_quiz(topic, num):
+    """Return a list of {question, options, correct} dicts (raises on failure)"""
+    model = genai.GenerativeModel(MODEL_NAME)
+
+    # 1. Define the configuration to force structured JSON output
+    config = GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=QUIZ_SCHEMA
+    )
+
+    # 2. Simplify the prompt since the model is now forced to follow the schema
+    prompt = QUIZ_PROMPT.format(num=num, topic=topic)
+
+    # 3. Pass the configuration to the content generation call
+    resp = model.generate_content(prompt, generation_config=config,
+                                  request_options={'timeout': Config.GEMINI_TIMEOUT})
+
+    try:
+        # Since the model is configured for JSON, the response text should be clean JSON
+        return json.loads(resp.text.strip())
+    except Exception:
+        # If parsing still fails (highly unlikely with structured output)
+        print(f"Raw response text: {resp.text}")
+        raise
+
+# ----------------- Generation cache -----------------
+def normalize_topic(topic):
+    """'  Python   Basics! ' and 'python basics' should share a cache entry"""
+    return ' '.join(re.findall(r'\w+', topic.lower()))
+
+def generation_key(topic, template):
+    """Content address of a generation: topic + model + prompt template"""
+    template_hash = hashlib.sha256(template.encode()).hexdigest()[:16]
+    raw = f"{MODEL_NAME}|{template_hash}|{normalize_topic(topic)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def docs_for(topic):
+    """Markdown for a topic, generated at most once per GEN_CACHE_TTL"""
+    key = generation_key(topic, DOCS_PROMPT)
+    markdown = generation_cache.get('docs', key)
+    if markdown is MISSING:
+        markdown = write_docs(topic)
+        generation_cache.set('docs', key, markdown, Config.GEN_CACHE_TTL)
+    return markdown
+
+def quiz_for(topic, num):
+    """``num`` questions sampled from the topic's cached question pool.
+
+    The pool is only topped up (and Gemini only called) when it holds
+    fewer than ``num`` questions.
+    """
+    key = generation_key(topic, QUIZ_PROMPT)
+    pool = generation_cache.get('quiz', key, [])
+    if len(pool) < num:
+        fresh = write_quiz(topic, max(num, QUIZ_POOL_BATCH))
+        known = {q['question'] for q in pool}
+        pool = (pool + [q for q in fresh if q['question'] not in known])[-QUIZ_POOL_MAX:]
+        generation_cache.set('quiz', key, pool, Config.GEN_CACHE_TTL)
+    return random.sample(pool, min(num, len(pool)))
+
+def save_docs(user, topic, markdown):
+    doc = Documentation(user_id=user.id, topic=topic, markdown=markdown)
+    db.session.add(doc)
+    db.session.commit()
+    invalidate_activity(user.id)
+    user.log_learning(topic, 'docs')
+
+def start_attempt(user_id, topic, quiz):
+    """Store a served quiz server-side; the page only gets ids, questions and options"""
+    attempt = QuizAttempt(user_id=user_id, topic=topic[:200])
+    attempt.questions = [
+        QuizQuestion(position=i, question=q['question'], options=json.dumps(q['options']),
+                     correct=str(q['correct']).strip()[:1].upper())
+        for i, q in enumerate(quiz)
+    ]
+    db.session.add(attempt)
+    db.session.commit()
+    return attempt
+
+# ----------------- Background jobs -----------------
+@jobs.register('docs')
+def docs_job(payload, user_id):
+    markdown = docs_for(payload['topic'])
+    save_docs(db.session.get(User, user_id), payload['topic'], markdown)
+    return {'markdown': markdown}
+
+@jobs.register('quiz')
+def quiz_job(payload, user_id):
+    return start_attempt(user_id, payload['topic'], quiz_for(payload['topic'], payload['num'])).to_dict()
+
+@bp.route('/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    """Queue a docs or quiz generation and return its id straight away"""
+    data = request.json or {}
+    kind = data.get('kind')
+    topic = data.get('topic')
+    if kind not in jobs.HANDLERS:
+        return jsonify({'error': 'Unknown job kind'}), 400
+    if not topic:
+        return jsonify({'error': 'Topic required'}), 400
+
+    payload = {'topic': topic}
+    if kind == 'quiz':
+        payload['num'] = int(data.get('num', 5))
+    job_id = jobs.submit(kind, current_user.id, payload)
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+@bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = jobs.get(job_id, current_user.id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+# ----------------- Synchronous endpoints -----------------
 @bp.route('/generate-docs', methods=['POST'])
 @login_required
 def generate_docs():
@@ -38,19 +185,53 @@ def generate_docs():
     if not topic:
         return jsonify({'error': 'Topic required'}), 400
 
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    prompt = f"""Write a concise learning document for "{topic}" in Markdown.
-Include: definition, key points, one code example, common pitfalls. Under 800 words."""
-    resp = model.generate_content(prompt)
-    markdown = resp.text.strip()
-
-    doc = Documentation(user_id=current_user.id, topic=topic, markdown=markdown)
-    db.session.add(doc)
-    db.session.commit()
-    current_user.log_learning(topic, 'docs')
+    markdown = docs_for(topic)
+    save_docs(current_user, topic, markdown)
 
     return jsonify({'markdown': markdown})
 
+@bp.route('/generate-docs/stream', methods=['POST'])
+@login_required
+def generate_docs_stream():
+    """Same as /generate-docs, but sent as server-sent events while it's written.
+
+    Each event carries {"text": chunk}; the last one is {"done": true} once
+    the full document has been saved (or {"error": ...}).
+    """
+    topic = (request.json or {}).get('topic')
+    if not topic:
+        return jsonify({'error': 'Topic required'}), 400
+
+    # current_user's session is closed once the view returns and the stream
+    # starts, so the generator reloads the user by id before writing
+    user_id = current_user.id
+
+    def sse(data):
+        return f"data: {json.dumps(data)}\n\n"
+
+    def events():
+        key = generation_key(topic, DOCS_PROMPT)
+        markdown = generation_cache.get('docs', key)
+        try:
+            if markdown is MISSING:
+                parts = []
+                for text in stream_docs(topic):
+                    parts.append(text)
+                    yield sse({'text': text})
+                markdown = ''.join(parts).strip()
+                generation_cache.set('docs', key, markdown, Config.GEN_CACHE_TTL)
+            else:
+                yield sse({'text': markdown})
+            save_docs(db.session.get(User, user_id), topic, markdown)
+        except Exception as e:
+            print(f"Gemini stream error: {e}")
+            yield sse({'error': 'Failed to generate documentation.'})
+            return
+        yield sse({'done': True})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @bp.route('/quiz')
 @login_required
 def quiz_page():
@@ -65,45 +246,35 @@ def generate_quiz():
     if not topic:
         return jsonify({'error': 'Topic required'}), 400
 
-    model = genai.GenerativeModel('gemini-2.5-flash') 
-    
-    # 1. Define the configuration to force structured JSON output
-    config = GenerationConfig(
-        response_mime_type="application/json",
-        response_schema=QUIZ_SCHEMA
-    )
-    
-    # 2. Simplify the prompt since the model is now forced to follow the schema
-    prompt = f"Generate {num} multiple-choice questions on the topic: '{topic}'."
-    
-    # 3. Pass the configuration to the content generation call
-    try:
-        # FIX: Changed 'config' to 'generation_config' to match the SDK's expected argument name
-        resp = model.generate_content(prompt, generation_config=config)
-    except Exception as e:
-        # Handle API call failures (e.g., network, authentication, etc.)
-        print(f"Gemini API Call Error: {e}")
-        return jsonify({'error': f'Failed to call Gemini API: {e}'}), 500
-
     try:
-        # Since the model is configured for JSON, the response text should be clean JSON
-        quiz = json.loads(resp.text.strip())
+        quiz = quiz_for(topic, num)
     except Exception as e:
-        # If parsing still fails (highly unlikely with structured output)
-        print(f"CRITICAL JSON Parse Error: {e}")
-        print(f"Raw response text: {resp.text}")
-        # Returning 500 here means we've definitively failed to process the request.
-        return jsonify({'error': 'Failed to parse structured response. Check server console for raw text.'}), 500
+        # Handle API call and parse failures (e.g., network, authentication, etc.)
+        print(f"Gemini quiz generation error: {e}")
+        return jsonify({'error': f'Failed to generate quiz: {e}'}), 500
 
-    session['current_quiz'] = quiz
-    return jsonify(quiz)
+    session.pop('current_quiz', None)   # left over from when quizzes lived in the cookie
+    return jsonify(start_attempt(current_user.id, topic, quiz).to_dict())
 
 @bp.route('/submit-quiz', methods=['POST'])
 @login_required
 def submit_quiz():
-    answers = request.json.get('answers', {})
-    quiz = session.get('current_quiz', [])
-    score = sum(1 for q in quiz if answers.get(q['question']) == q['correct'])
+    """Score {"quiz_id": id, "answers": {question_id: "A"}} and record each answer"""
+    data = request.json or {}
+    answers = data.get('answers') or {}
+    attempt = db.session.get(QuizAttempt, data.get('quiz_id') or 0)
+    if attempt is None or attempt.user_id != current_user.id:
+        return jsonify({'error': 'Quiz not found'}), 404
+    if attempt.submitted_at is not None:
+        return jsonify({'error': 'Quiz already submitted'}), 409
+
+    results = {}
+    for q in attempt.questions:
+        q.answer = (str(answers.get(str(q.id)) or '')[:1].upper()) or None
+        q.is_correct = q.answer == q.correct
+        results[q.id] = q.is_correct
+    attempt.score = sum(results.values())
+    attempt.submitted_at = datetime.utcnow()
     current_user.update_streak()
     db.session.commit()
-    return jsonify({'score': score, 'total': len(quiz)})
+    return jsonify({'score': attempt.score, 'total': len(results), 'results': results})
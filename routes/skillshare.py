@@ -1,10 +1,18 @@
 # routes/skillshare.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, abort, send_file
 from flask_login import login_required, current_user
-from  models import db, SkillPost, Like
+from  models import db, SkillPost, Like, UploadSession, insert_for
+from config import Config
+import media
+import uploads
+from uploads import ALLOWED_EXTENSIONS, UploadError
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import selectinload
+from datetime import datetime
 import os
 import uuid
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 
 # Create the blueprint
 skillshare = Blueprint(
@@ -13,23 +21,100 @@ skillshare = Blueprint(
     url_prefix='/skillshare'
 )
 
-# Allowed video extensions
-ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi'}
+# Posts per feed page
+PAGE_SIZE = 10
+
+# Uploaded files get a fresh uuid name and are never rewritten, so caches may keep them for good
+MEDIA_MAX_AGE = 365 * 86400
+MEDIA_TYPES = {'mp4': 'video/mp4', 'mov': 'video/quicktime', 'avi': 'video/x-msvideo', 'jpg': 'image/jpeg'}
+
+# Room for the title/description fields around a single-request upload
+FORM_OVERHEAD = 1024 * 1024
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def encode_cursor(post):
+    return f"{post.created_at.isoformat()}_{post.id}"
+
+def decode_cursor(cursor):
+    """'<created_at iso>_<id>' -> (datetime, id), or None if malformed"""
+    try:
+        created, post_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created), int(post_id)
+    except (AttributeError, ValueError):
+        return None
+
+def liked_post_ids(post_ids, user_id):
+    """Which of these posts user_id has liked, in one query"""
+    if not post_ids or user_id is None:
+        return set()
+    rows = db.session.query(Like.post_id).filter(Like.user_id == user_id, Like.post_id.in_(post_ids))
+    return {post_id for post_id, in rows}
+
+def set_like(post_id, user_id, liked):
+    """Make user_id's like on post_id match ``liked`` and return the new count.
+
+    The Like row and SkillPost.like_count change in the same transaction,
+    with the count adjusted in SQL (like_count + 1), so concurrent likes
+    never lose an update. The insert is ON CONFLICT DO NOTHING against
+    uq_user_post, so a repeated like is a no-op.
+    Aborts with 404 if the post doesn't exist - checked up front rather than
+    left to the FK, which SQLite doesn't enforce and Postgres reports as a 500.
+    """
+    if db.session.get(SkillPost, post_id) is None:
+        abort(404)
+    if liked:
+        res = db.session.execute(insert_for(Like).values(user_id=user_id, post_id=post_id)
+                                 .on_conflict_do_nothing(index_elements=['user_id', 'post_id']))
+        delta = res.rowcount   # 0 if it was already liked
+    else:
+        delta = -Like.query.filter_by(user_id=user_id, post_id=post_id).delete()
+
+    if delta:
+        res = db.session.execute(update(SkillPost).where(SkillPost.id == post_id)
+                                 .values(like_count=SkillPost.like_count + delta))
+        if res.rowcount == 0:
+            db.session.rollback()
+            abort(404)
+    count = db.session.query(SkillPost.like_count).filter_by(id=post_id).scalar()
+    if count is None:
+        db.session.rollback()
+        abort(404)
+    db.session.commit()
+    return count
+
 # ———————————————————————— Routes ————————————————————————
 
 @skillshare.route('/')
 def index():
-    posts = SkillPost.query.order_by(SkillPost.created_at.desc()).all()
-    return render_template('index.html', posts=posts)
+    """Newest posts first, PAGE_SIZE at a time; ?after=<cursor> continues the feed"""
+    user_id = current_user.id if current_user.is_authenticated else None
+    query = SkillPost.query.options(selectinload(SkillPost.author))
+    # Posts still being transcoded are only shown to their author
+    query = query.filter(or_(SkillPost.status != 'processing', SkillPost.user_id == user_id))
+    cursor = decode_cursor(request.args.get('after'))
+    if cursor:
+        created, post_id = cursor
+        query = query.filter(or_(
+            SkillPost.created_at < created,
+            and_(SkillPost.created_at == created, SkillPost.id < post_id),
+        ))
+    posts = query.order_by(SkillPost.created_at.desc(), SkillPost.id.desc()).limit(PAGE_SIZE + 1).all()
+
+    next_cursor = encode_cursor(posts[PAGE_SIZE - 1]) if len(posts) > PAGE_SIZE else None
+    posts = posts[:PAGE_SIZE]
+    liked = liked_post_ids([p.id for p in posts], user_id)
+    return render_template('index.html', posts=posts, liked=liked, next_cursor=next_cursor)
 
 @skillshare.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload():
     if request.method == 'POST':
+        # Plain multipart fallback for browsers without fetch: the whole video
+        # in one body, so lift the app-wide chunk-sized limit for this request
+        # only (file parts are spooled to disk, not held in memory)
+        request.max_content_length = Config.UPLOAD_MAX_BYTES + FORM_OVERHEAD
         title = request.form.get('title')
         description = request.form.get('description')
         file = request.files.get('video')
@@ -53,30 +138,123 @@ def upload():
             title=title,
             description=description,
             video_filename=filename,
-            user_id=current_user.id
+            user_id=current_user.id,
+            status='processing'
         )
         db.session.add(post)
         db.session.commit()
+        media.submit(post.id)
 
-        flash('Video uploaded successfully!', 'success')
+        flash('Video uploaded! It will appear once it has been processed.', 'success')
         return redirect(url_for('skillshare.index'))
 
-    return render_template('upload.html')
+    return render_template('upload.html', chunk_size=Config.UPLOAD_CHUNK_BYTES,
+                           max_bytes=Config.UPLOAD_MAX_BYTES)
+
+@skillshare.route('/media/<filename>')
+def media_file(filename):
+    """Serve an uploaded video (or its poster) with Range (206) support, a strong ETag and far-future caching.
+
+    With MEDIA_ACCEL set, only headers leave Flask and the front server
+    streams the file (and answers Range requests) itself.
+    """
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    if path is None or filename.startswith('.') or not os.path.isfile(path):
+        abort(404)
+    mimetype = MEDIA_TYPES.get(filename.rsplit('.', 1)[-1].lower(), 'application/octet-stream')
+    # Name + size is enough: a uuid-named file never changes in place
+    etag = f"{filename.rsplit('.', 1)[0]}-{os.path.getsize(path):x}"
+
+    if Config.MEDIA_ACCEL == 'x-accel':
+        res = current_app.response_class(mimetype=mimetype)
+        res.headers['X-Accel-Redirect'] = Config.MEDIA_ACCEL_PREFIX + filename
+        res.set_etag(etag)
+    else:
+        # conditional=True: 304 on If-None-Match, 206 on Range/If-Range;
+        # USE_X_SENDFILE (MEDIA_ACCEL=x-sendfile) swaps the body for a header
+        res = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=MEDIA_MAX_AGE)
+    res.headers['Cache-Control'] = f"public, max-age={MEDIA_MAX_AGE}, immutable"
+    res.headers['Accept-Ranges'] = 'bytes'
+    return res
+
+# ———————————————————————— Resumable uploads (see uploads.py) ————————————————————————
+
+def own_upload(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        abort(404)
+    return upload
+
+@skillshare.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+@skillshare.route('/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    data = request.get_json(silent=True) or {}
+    upload = uploads.start(current_user.id, data.get('filename') or '', data.get('size'),
+                           data.get('title'), data.get('description'), data.get('sha256'))
+    return jsonify({'upload_id': upload.id, 'offset': 0,
+                    'chunk_size': Config.UPLOAD_CHUNK_BYTES}), 201
+
+@skillshare.route('/uploads/<upload_id>', methods=['HEAD', 'GET'])
+@login_required
+def upload_status(upload_id):
+    """Where to resume: the number of bytes the server has kept"""
+    upload = own_upload(upload_id)
+    res = jsonify({'upload_id': upload.id, 'offset': upload.received, 'size': upload.size})
+    res.headers['Upload-Offset'] = str(upload.received)
+    res.headers['Upload-Length'] = str(upload.size)
+    res.headers['Cache-Control'] = 'no-store'
+    return res
+
+@skillshare.route('/uploads/<upload_id>', methods=['PATCH'])
+@login_required
+def upload_chunk(upload_id):
+    upload = own_upload(upload_id)
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        raise UploadError('Upload-Offset header is required')
+    offset = uploads.write_chunk(upload, offset, request.stream, request.headers.get('Upload-Checksum'))
+
+    body = {'upload_id': upload_id, 'offset': offset}
+    if offset == upload.size:
+        post = uploads.complete(upload)
+        body['post_id'] = post.id
+        flash('Video uploaded! It will appear once it has been processed.', 'success')
+    res = jsonify(body)
+    res.headers['Upload-Offset'] = str(offset)
+    return res
+
+@skillshare.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(upload_id):
+    uploads.abandon(own_upload(upload_id))
+    return '', 204
 
 @skillshare.route('/like/<int:post_id>', methods=['POST'])
 @login_required
 def like(post_id):
-    post = SkillPost.query.get_or_404(post_id)
-    existing_like = Like.query.filter_by(user_id=current_user.id, post_id=post_id).first()
+    """Form fallback: toggle and reload the feed"""
+    liked = Like.query.filter_by(user_id=current_user.id, post_id=post_id).first() is None
+    set_like(post_id, current_user.id, liked)
+    flash('Liked!' if liked else 'Unliked.', 'success' if liked else 'info')
+    return redirect(url_for('skillshare.index'))
 
-    if existing_like:
-        db.session.delete(existing_like)
-        db.session.commit()
-        flash('Unliked.', 'info')
-    else:
-        like = Like(user_id=current_user.id, post_id=post_id)
-        db.session.add(like)
-        db.session.commit()
-        flash('Liked!', 'success')
+@skillshare.route('/like/<int:post_id>/toggle', methods=['POST'])
+@login_required
+def toggle_like(post_id):
+    """JSON like toggle for the feed's AJAX button.
 
-    return redirect(url_for('skillshare.index'))
\ No newline at end of file
+    Send {"liked": true/false} to set the state explicitly (safe to retry);
+    without it the current state is flipped.
+    """
+    data = request.get_json(silent=True) or {}
+    if 'liked' in data:
+        liked = bool(data['liked'])
+    else:
+        liked = Like.query.filter_by(user_id=current_user.id, post_id=post_id).first() is None
+    count = set_like(post_id, current_user.id, liked)
+    return jsonify({'post_id': post_id, 'liked': liked, 'like_count': count})
@@ -1,26 +1,73 @@
 # routes/youtube.py
-from flask import Blueprint, render_template, request, jsonify
-import requests
+from flask import Blueprint, render_template, request, jsonify, Response, stream_with_context
+from http_client import client
 from config import Config
+from cache import cache, MISSING
+from transcript_index import transcript_index
+from quota import quota
+from singleflight import SingleFlight
 from flask_login import login_required, current_user
-from models import db, PlaylistItem
+from models import db, PlaylistItem, User, insert_for
+from datetime import datetime
+import jobs
+from routes.dashboard import invalidate_activity
+import ranking
 import isodate
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
-import re
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, TimeoutError as FuturesTimeout
+import json
+import threading
+import time
 
 bp = Blueprint('youtube', __name__)
 
 # ----------------- Filters -----------------
 MIN_VIEWS = 20
 MAX_RESULTS = 10
+STATS_BATCH_SIZE = 50   # videos.list accepts at most 50 ids per call
 BLACKLIST_WORDS = ['strategy', 'motivational', 'tips', 'hack', 'vlog', 'challenge', 'story', 'reaction']
 
+# ----------------- Enrichment -----------------
+ENRICH_WORKERS = 16     # shared by all searches in this process
+ENRICH_DEADLINE = 6     # seconds a single search may spend enriching candidates
+HTTP_TIMEOUT = 5        # per outbound call, so a stuck socket can't outlive the deadline
+
+_enrich_pool = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix='yt-enrich')
+
+# Concurrent identical searches (same build_query) share one computation
+_searches = SingleFlight()
+
+# build_query -> (survivors, deadline) while a search is still enriching, so
+# streams that start mid-flight attach to its lookups instead of their own
+_live = {}
+_live_lock = threading.Lock()
+
+# ----------------- Cache TTLs (seconds) -----------------
+# Counts move quickly, search rankings slowly, transcripts practically never
+CACHE_TTL = {
+    'search': 6 * 3600,
+    'stats': 15 * 60,
+    'comments': 6 * 3600,
+    'transcript': 30 * 86400,
+}
+
 # ----------------- Routes -----------------
 @bp.route('/playlists')
 @login_required
 def playlists_page():
     return render_template('playlists.html')
 
+@bp.route('/cache-stats')
+@login_required
+def cache_stats():
+    return jsonify(cache.stats())
+
+@bp.route('/quota')
+@login_required
+def quota_usage():
+    """API units left and spent today, what is being skipped, and search coalescing counts"""
+    return jsonify({**quota.usage(), 'searches': _searches.stats()})
+
 # ----------------- Helper Functions -----------------
 def build_query(topic, level):
     base_keywords = ["tutorial", "course", "lesson", "study", "explained", "step-by-step", "project"]
@@ -38,7 +85,38 @@ def build_query(topic, level):
     query = f"{topic} {' '.join(keywords)}"
     return query
 
-def get_positive_comments(video_id, max_comments=3):
+def search_videos(query):
+    """Return the raw search.list items for a query (cached)"""
+    items = cache.get('search', query)
+    if items is not MISSING:
+        return items
+    if not quota.spend('search'):
+        return []
+
+    search_url = 'https://www.googleapis.com/youtube/v3/search'
+    search_params = {
+        'part': 'snippet',
+        'q': query,
+        'type': 'video',
+        'maxResults': 30,
+        'key': Config.YOUTUBE_API_KEY
+    }
+    search_res = client.get(search_url, params=search_params, timeout=HTTP_TIMEOUT).json()
+    if 'items' not in search_res:
+        # Quota/key errors come back as a JSON error body - don't cache those
+        quota.observe(search_res)
+        print("Search API Error:", search_res.get('error', {}).get('message'))
+        return []
+    cache.set('search', query, search_res['items'], CACHE_TTL['search'])
+    return search_res['items']
+
+def get_positive_comments(video_id, max_comments=3, fetch=True):
+    """Liked top comments; None if not cached and fetch is off or the quota says no"""
+    cached = cache.get('comments', f"{video_id}:{max_comments}")
+    if cached is not MISSING:
+        return cached
+    if not fetch or not quota.spend('commentThreads'):
+        return None
     try:
         url = 'https://www.googleapis.com/youtube/v3/commentThreads'
         params = {
@@ -49,141 +127,282 @@ def get_positive_comments(video_id, max_comments=3):
             'textFormat': 'plainText',
             'key': Config.YOUTUBE_API_KEY
         }
-        res = requests.get(url, params=params).json()
+        res = client.get(url, params=params, timeout=HTTP_TIMEOUT).json()
+        if quota.observe(res):
+            return None
         comments = []
         for item in res.get('items', []):
             snippet = item['snippet']['topLevelComment']['snippet']
             text = snippet['textDisplay']
             if snippet.get('likeCount', 0) > 0:
                 comments.append(text)
+        if 'items' in res:
+            cache.set('comments', f"{video_id}:{max_comments}", comments, CACHE_TTL['comments'])
         return comments
     except:
         return []
 
-def transcript_match_score(video_id, topic):
-    """Return relevance score (0 to 1) based on transcript matching"""
+def index_transcript(video_id):
+    """Download a transcript and add its term counts to the index"""
     try:
         transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-        transcript_text = " ".join([t['text'] for t in transcript_list]).lower()
-        topic_words = re.findall(r'\w+', topic.lower())
-        match_count = sum(1 for word in topic_words if word in transcript_text)
-        return match_count / len(topic_words) if topic_words else 0
+        text = " ".join([t['text'] for t in transcript_list])
     except (TranscriptsDisabled, NoTranscriptFound):
-        return 0
+        text = ''
     except:
+        # Network trouble etc. - try again next time
+        return False
+    transcript_index.add(video_id, text)
+    return True
+
+def transcript_match_score(video_id, topic, fetch=True):
+    """Return relevance score (0 to 1) of the transcript for the topic (BM25).
+
+    None if the transcript isn't indexed yet and fetch is off.
+    """
+    try:
+        if not transcript_index.is_indexed(video_id, CACHE_TTL['transcript']):
+            if not fetch:
+                return None
+            if not index_transcript(video_id):
+                return 0
+        return transcript_index.score(video_id, topic)
+    except Exception as e:
+        print("Transcript index error:", e)
         return 0
 
-# ----------------- Main Search -----------------
-@bp.route('/search')
-@login_required
-def search():
-    topic = request.args.get('q', '').strip()
-    level = request.args.get('level', 'medium')
+def fetch_video_stats(video_ids):
+    """Return {video_id: {views, likes, comments, duration}} for many videos.
 
-    if not topic:
-        return jsonify([])
+    videos.list takes up to STATS_BATCH_SIZE comma-separated ids, so a whole
+    search page costs one request (and one quota unit) instead of one per
+    video; ids already in the cache aren't requested at all. Ids missing
+    from the response (deleted, private) are left out.
+    """
+    stats_url = 'https://www.googleapis.com/youtube/v3/videos'
+    found = {}
+    to_fetch = []
+    for vid in video_ids:
+        info = cache.get('stats', vid)
+        if info is MISSING:
+            to_fetch.append(vid)
+        else:
+            found[vid] = info
 
-    query = build_query(topic, level)
-    search_url = 'https://www.googleapis.com/youtube/v3/search'
-    search_params = {
-        'part': 'snippet',
-        'q': query,
-        'type': 'video',
-        'maxResults': 30,
-        'key': Config.YOUTUBE_API_KEY
-    }
+    for i in range(0, len(to_fetch), STATS_BATCH_SIZE):
+        batch = to_fetch[i:i + STATS_BATCH_SIZE]
+        if not quota.spend('videos'):
+            break
+        stats_params = {'part': 'statistics,contentDetails', 'id': ','.join(batch), 'key': Config.YOUTUBE_API_KEY}
+        try:
+            stats_res = client.get(stats_url, params=stats_params, timeout=HTTP_TIMEOUT).json()
+        except Exception as e:
+            print("Stats API Error:", e)
+            continue
+        if quota.observe(stats_res):
+            break
 
+        for video_info in stats_res.get('items', []):
+            stats = video_info.get('statistics', {})
+            details = video_info.get('contentDetails', {})
+            try:
+                found[video_info['id']] = {
+                    'views': int(stats.get('viewCount', 0)),
+                    'likes': int(stats.get('likeCount', 0)),
+                    'comments': int(stats.get('commentCount', 0)),
+                    'duration': isodate.parse_duration(details.get('duration', 'PT0S')).total_seconds() / 60,
+                }
+            except:
+                continue
+            cache.set('stats', video_info['id'], found[video_info['id']], CACHE_TTL['stats'])
+    return found
+
+def _remaining(deadline):
+    return max(deadline - time.monotonic(), 0)
+
+def start_enrichment(candidates, topic):
+    """Batched stats for every candidate, then queue comments/transcript lookups.
+
+    Stats come from one videos.list call and decide who survives the
+    MIN_VIEWS / duration filters; comments and transcript are then fetched
+    concurrently on the shared pool for survivors only. When the API quota
+    runs low, uncached comments (and then transcripts) are skipped and come
+    back as None.
+    Returns (video, stats, comments_future, transcript_future) tuples in
+    search order.
+    """
+    all_stats = fetch_video_stats([v['id']['videoId'] for v in candidates])
+    with_comments = quota.allows('comments')
+    with_transcripts = quota.allows('transcripts')
+
+    survivors = []
+    for video in candidates:
+        vid = video['id']['videoId']
+        info = all_stats.get(vid)
+        if not info or info['duration'] < 1 or info['views'] < MIN_VIEWS:
+            continue
+        survivors.append((
+            video,
+            info,
+            _enrich_pool.submit(get_positive_comments, vid, fetch=with_comments),
+            _enrich_pool.submit(transcript_match_score, vid, topic, fetch=with_transcripts),
+        ))
+    return survivors
+
+def settle(survivor):
+    """(video, stats, comments, transcript_score) with None for lookups still running (abandoned)"""
+    video, info, comments_fut, transcript_fut = survivor
+    comments = comments_fut.result() if comments_fut.done() else None
+    transcript_score = transcript_fut.result() if transcript_fut.done() else None
+    comments_fut.cancel()
+    transcript_fut.cancel()
+    return video, info, comments, transcript_score
+
+def start_search(topic, level):
+    """(survivors, deadline) for a search, shared by every identical search in flight.
+
+    The first caller runs search.list + stats and queues the lookups; callers
+    arriving while that runs wait for it (SingleFlight), and callers arriving
+    later, before the deadline, get the same survivor futures from ``_live``.
+    """
+    key = build_query(topic, level)
+    now = time.monotonic()
+    with _live_lock:
+        for k in [k for k, (_, deadline) in _live.items() if deadline <= now]:
+            del _live[k]
+        if key in _live:
+            return _live[key]
+
+    def start():
+        survivors = start_enrichment(find_candidates(topic, level), topic)
+        entry = survivors, time.monotonic() + ENRICH_DEADLINE
+        with _live_lock:
+            _live[key] = entry
+        return entry
+
+    entry, _ = _searches.do(('start', key), start)
+    return entry
+
+def enrich_candidates(topic, level):
+    """Enrich every candidate, giving up on lookups still running at the deadline.
+
+    Returns a list of (video, stats, comments, transcript_score) tuples in
+    search order; abandoned lookups are None so the caller can score with
+    what it has.
+    """
+    survivors, deadline = start_search(topic, level)
+    wait([f for _, _, cf, tf in survivors for f in (cf, tf)], timeout=_remaining(deadline))
+    return [settle(s) for s in survivors]
+
+def save_playlist(user_id, topic, level, results):
+    """Bulk-upsert a search's results into PlaylistItem in one statement.
+
+    (user_id, url) is unique, so searching the same topic again refreshes
+    the existing rows (and bumps searched_at) instead of adding duplicates.
+    """
+    now = datetime.utcnow()
+    rows = [{
+        'user_id': user_id,
+        'topic': topic,
+        'difficulty': level,
+        'title': r['title'],
+        'url': f"https://www.youtube.com/watch?v={r['id']}",
+        'thumbnail': r['thumb'],
+        'channel': r['channel'],
+        'searched_at': now,
+    } for r in results]
+
+    stmt = insert_for(PlaylistItem).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'url'],
+        set_={col: stmt.excluded[col] for col in ('topic', 'difficulty', 'title', 'thumbnail', 'channel', 'searched_at')},
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+    invalidate_activity(user_id)
+
+# ----------------- Main Search -----------------
+def find_candidates(topic, level):
+    """search.list results that pass the cheap title filters"""
     try:
-        search_res = requests.get(search_url, params=search_params).json()
-        videos = search_res.get('items', [])
+        videos = search_videos(build_query(topic, level))
     except Exception as e:
         print("Search API Error:", e)
-        return jsonify([])
+        return []
 
-    results = []
+    # Cheap title filters first, so we only enrich real candidates
+    candidates = []
     seen_video_ids = set()
-
     for video in videos:
         vid = video['id'].get('videoId')
         if not vid or vid in seen_video_ids:
             continue
-
         title_lower = video['snippet']['title'].lower()
         if any(word in title_lower for word in BLACKLIST_WORDS):
             continue
+        seen_video_ids.add(vid)
+        candidates.append(video)
+    return candidates
 
-        stats_url = 'https://www.googleapis.com/youtube/v3/videos'
-        stats_params = {'part': 'statistics,contentDetails', 'id': vid, 'key': Config.YOUTUBE_API_KEY}
-        try:
-            stats_res = requests.get(stats_url, params=stats_params).json()
-            items_stats = stats_res.get('items', [])
-            if not items_stats:
-                continue
-        except:
-            continue
+def to_result(candidate, score, final=False):
+    """The JSON shape of one ranked video.
 
-        video_info = items_stats[0]
-        stats = video_info.get('statistics', {})
-        details = video_info.get('contentDetails', {})
+    Missing comments/transcript mean ``partial`` (still being scored) while
+    streaming; in ``final`` results nothing more is coming, so they mean
+    ``incomplete`` instead (skipped for quota or cut off by the deadline).
+    """
+    video, info, comments, transcript_score = candidate
+    views = info['views']
+    likes = info['likes']
+    total_comments = info['comments']
+    duration = info['duration']
+    missing = comments is None or transcript_score is None
+    comments = comments or []
+    transcript_score = transcript_score or 0
 
-        views = int(stats.get('viewCount', 0))
-        likes = int(stats.get('likeCount', 0))
-        total_comments = int(stats.get('commentCount', 0))
-        duration = isodate.parse_duration(details.get('duration', 'PT0S')).total_seconds() / 60
+    like_ratio = (likes / views) * 100 if views else 0
+    positive_comment_percentage = round((len(comments) / total_comments) * 100, 1) if total_comments else 0
+    watch_hours = round((views * duration) / 60, 1)
 
-        if duration < 1 or views < MIN_VIEWS:
-            continue
+    return {
+        'title': video['snippet']['title'],
+        'id': video['id']['videoId'],
+        'thumb': video['snippet']['thumbnails']['medium']['url'],
+        'channel': video['snippet']['channelTitle'],
+        'views': views,
+        'likes': likes,
+        'duration': round(duration, 1),
+        'watch_hours': watch_hours,
+        'positive_comments': comments,
+        'positive_comment_percentage': positive_comment_percentage,
+        'like_ratio': round(like_ratio, 1),
+        'transcript_score': round(transcript_score*100,1),
+        'score': round(score, 1),
+        'partial': missing and not final,
+        'incomplete': missing and final,
+    }
 
-        like_ratio = (likes / views) * 100 if views else 0
-        comments = get_positive_comments(vid)
-        positive_comment_percentage = round((len(comments) / total_comments) * 100, 1) if total_comments else 0
-        watch_hours = round((views * duration) / 60, 1)
-        transcript_score = transcript_match_score(vid, topic)
-
-        # ----------------- Smart Score -----------------
-        score = (
-            transcript_score * 0.5 +         # 50% transcript match
-            min(like_ratio/100, 1) * 0.2 +  # 20% like ratio
-            min(watch_hours/1000, 1) * 0.15 + # 15% watch hours (scaled)
-            (positive_comment_percentage/100) * 0.15  # 15% positive comments
-        ) * 100  # convert to 0-100 scale
-
-        # Save to DB
-        try:
-            pl_item = PlaylistItem(
-                user_id=current_user.id,
-                topic=topic,
-                difficulty=level,
-                title=video['snippet']['title'],
-                url=f"https://www.youtube.com/watch?v={vid}",
-                thumbnail=video['snippet']['thumbnails']['medium']['url'],
-                channel=video['snippet']['channelTitle']
-            )
-            db.session.add(pl_item)
-            db.session.commit()
-        except:
-            pass
-
-        results.append({
-            'title': video['snippet']['title'],
-            'id': vid,
-            'thumb': video['snippet']['thumbnails']['medium']['url'],
-            'channel': video['snippet']['channelTitle'],
-            'views': views,
-            'likes': likes,
-            'duration': round(duration, 1),
-            'watch_hours': watch_hours,
-            'positive_comments': comments,
-            'positive_comment_percentage': positive_comment_percentage,
-            'like_ratio': round(like_ratio, 1),
-            'transcript_score': round(transcript_score*100,1),
-            'score': round(score, 1)
-        })
+def find_videos(topic, level):
+    """Search, filter, enrich and rank - the part of a search that is the same for every user"""
+    enriched = enrich_candidates(topic, level)
+    # Score the whole batch at once; only the top MAX_RESULTS become dicts
+    return [to_result(c, score, final=True) for c, score in ranking.rank(enriched, level, MAX_RESULTS)]
 
-        seen_video_ids.add(vid)
+@bp.route('/search')
+@login_required
+def search():
+    topic = request.args.get('q', '').strip()
+    level = request.args.get('level', 'medium')
+
+    if not topic:
+        return jsonify([])
+
+    # A class searching the same topic at once pays for one search, not thirty
+    results, _ = _searches.do(build_query(topic, level), find_videos, topic, level)
 
-    # Sort by smart score
-    results = sorted(results, key=lambda x: x['score'], reverse=True)
+    # One upsert for the whole page, after the response is on its way
+    if results:
+        jobs.run_in_background(save_playlist, current_user.id, topic, level, results)
 
     try:
         current_user.log_learning(topic, 'video', level)
@@ -191,3 +410,68 @@ def search():
         pass
 
     return jsonify(results)
+
+@bp.route('/search/stream')
+@login_required
+def search_stream():
+    """/search as server-sent events, so cards show up after the first API calls.
+
+    Events, each a JSON object:
+      {"results": [...], "limit": MAX_RESULTS}  every survivor, scored on
+                                                 stats alone (partial: true)
+      {"update": {...}}                          one video rescored once its
+                                                 comments and transcript are in
+      {"done": true, "results": [...]}           the final top MAX_RESULTS; never
+                                                 partial, but incomplete: true
+                                                 where lookups were skipped
+    The page keeps the best ``limit`` by score and re-sorts on every update.
+    """
+    topic = request.args.get('q', '').strip()
+    level = request.args.get('level', 'medium')
+    if not topic:
+        return jsonify([])
+
+    # current_user is detached once streaming starts; reload by id at the end
+    user_id = current_user.id
+
+    def sse(data):
+        return f"data: {json.dumps(data)}\n\n"
+
+    def events():
+        # Shares search.list, stats and the lookups with identical searches in flight
+        survivors, deadline = start_search(topic, level)
+        preliminary = [(video, info, None, None) for video, info, _, _ in survivors]
+        yield sse({'results': [to_result(c, score) for c, score in ranking.rank(preliminary, level)],
+                   'limit': MAX_RESULTS})
+
+        # Rescore a video as soon as both of its lookups have finished
+        owner = {}
+        for i, (_, _, comments_fut, transcript_fut) in enumerate(survivors):
+            owner[comments_fut] = owner[transcript_fut] = i
+        pending = {i: 2 for i in range(len(survivors))}
+        try:
+            for future in as_completed(owner, timeout=_remaining(deadline)):
+                i = owner[future]
+                pending[i] -= 1
+                if pending[i] == 0:
+                    candidate = settle(survivors[i])
+                    (_, score), = ranking.rank([candidate], level)
+                    yield sse({'update': to_result(candidate, score)})
+        except FuturesTimeout:
+            pass   # whatever is still running is scored as partial below
+
+        results = [to_result(c, score, final=True)
+                   for c, score in ranking.rank([settle(s) for s in survivors], level, MAX_RESULTS)]
+
+        # Persist before the last event: a client that leaves once it has
+        # "done" closes the generator, and nothing after the yield would run
+        if results:
+            jobs.run_in_background(save_playlist, user_id, topic, level, results)
+        try:
+            db.session.get(User, user_id).log_learning(topic, 'video', level)
+        except Exception as e:
+            print("Learning log error:", e)
+        yield sse({'done': True, 'results': results})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
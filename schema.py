@@ -0,0 +1,182 @@
+# schema.py
+"""Versioned schema upgrades, run once when the app starts.
+
+The database records the last migration it has seen in ``schema_version``.
+``upgrade()`` applies anything newer in order and bumps the number, so a
+normal start costs one tiny SELECT instead of a ``create_all()`` (and its
+table reflection) on every request.
+
+Every gunicorn worker calls ``upgrade()`` at boot, so the migrating part
+runs under a cross-process lock (``pg_advisory_lock`` on Postgres, a
+``flock`` next to the database file on SQLite): the first worker applies
+the steps, the rest wait and then find nothing left to do. Steps that copy
+data (the learning backfill) are not safe to run twice concurrently.
+
+To change the schema, append a step to MIGRATIONS. Steps must still be
+safe to re-run: a brand-new database gets every table from ``create_all()``
+in step 1 and then still walks through the later steps. Use
+``add_column`` / ``create_index`` rather than raw DDL for that reason.
+"""
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from models import db, backfill_learning_events, make_preview, UploadSession, QuizAttempt, QuizQuestion
+
+try:
+    import fcntl
+except ImportError:   # Windows: no cross-process lock, run init-db before starting workers
+    fcntl = None
+
+PG_LOCK_KEY = 0x5c4e3a   # arbitrary, just has to be the same in every process
+
+
+def add_column(table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there."""
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    if column not in columns:
+        db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+def create_index(name, table, columns, unique=False):
+    unique_sql = 'UNIQUE ' if unique else ''
+    db.session.execute(text(
+        f'CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'))
+
+
+# ----------------- Migrations -----------------
+def _baseline():
+    db.create_all()
+
+
+def _backfill_learning():
+    backfill_learning_events()
+
+
+def _dedupe_playlist_items():
+    # Keep the newest copy of each (user, url) before making the pair unique
+    db.session.execute(text(
+        'DELETE FROM playlist_item WHERE id NOT IN '
+        '(SELECT MAX(id) FROM playlist_item GROUP BY user_id, url)'))
+    create_index('uq_playlist_item_user_url', 'playlist_item', ['user_id', 'url'], unique=True)
+
+
+def _feed_indexes():
+    create_index('ix_skill_post_created_id', 'skill_post', ['created_at', 'id'])
+    create_index('ix_like_post', 'like', ['post_id'])
+
+
+def _like_count():
+    add_column('skill_post', 'like_count', 'INTEGER NOT NULL DEFAULT 0')
+    db.session.execute(text(
+        'UPDATE skill_post SET like_count = '
+        '(SELECT COUNT(*) FROM "like" WHERE "like".post_id = skill_post.id)'))
+
+
+def _upload_sessions():
+    UploadSession.__table__.create(db.engine, checkfirst=True)
+
+
+def _video_processing():
+    # Existing posts were served as uploaded, so they start out 'ready'
+    add_column('skill_post', 'status', "VARCHAR(20) NOT NULL DEFAULT 'ready'")
+    add_column('skill_post', 'poster_filename', 'VARCHAR(200)')
+    add_column('skill_post', 'duration', 'FLOAT')
+
+
+def _quiz_store():
+    QuizAttempt.__table__.create(db.engine, checkfirst=True)
+    QuizQuestion.__table__.create(db.engine, checkfirst=True)
+
+
+def _dashboard_read_model():
+    create_index('ix_playlist_item_user_recent', 'playlist_item', ['user_id', 'searched_at DESC'])
+    create_index('ix_documentation_user_recent', 'documentation', ['user_id', 'generated_at DESC'])
+    add_column('documentation', 'preview', 'VARCHAR(300)')
+    rows = db.session.execute(text('SELECT id, markdown FROM documentation WHERE preview IS NULL')).all()
+    for doc_id, markdown in rows:
+        db.session.execute(text('UPDATE documentation SET preview = :p WHERE id = :id'),
+                           {'p': make_preview(markdown), 'id': doc_id})
+
+
+def _job_started_at():
+    add_column('generation_job', 'started_at', 'TIMESTAMP')
+
+
+# (version, description, step) - append only, never renumber
+MIGRATIONS = [
+    (1, 'create tables', _baseline),
+    (2, 'move User.learned strings into learning_event', _backfill_learning),
+    (3, 'unique playlist items per user and url', _dedupe_playlist_items),
+    (4, 'skillshare feed indexes', _feed_indexes),
+    (5, 'denormalised skill_post.like_count', _like_count),
+    (6, 'resumable upload sessions', _upload_sessions),
+    (7, 'skill_post processing status, poster and duration', _video_processing),
+    (8, 'server-side quiz attempts', _quiz_store),
+    (9, 'dashboard indexes and documentation.preview', _dashboard_read_model),
+    (10, 'generation_job.started_at', _job_started_at),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def recorded_version():
+    """The version in schema_version, or None if there is none yet (read-only)."""
+    try:
+        version = db.session.execute(text('SELECT MAX(version) FROM schema_version')).scalar()
+    except (OperationalError, ProgrammingError):   # table doesn't exist yet
+        version = None
+    db.session.rollback()   # don't sit on the read transaction
+    return version
+
+
+def current_version():
+    db.session.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+    version = db.session.execute(text('SELECT version FROM schema_version')).scalar()
+    if version is None:
+        db.session.execute(text('INSERT INTO schema_version (version) VALUES (0)'))
+        version = 0
+    db.session.commit()
+    return version
+
+
+@contextmanager
+def upgrade_lock():
+    """Hold a lock that only one process at a time can have."""
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('SELECT pg_advisory_lock(:k)'), {'k': PG_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text('SELECT pg_advisory_unlock(:k)'), {'k': PG_LOCK_KEY})
+        return
+    path = engine.url.database if engine.dialect.name == 'sqlite' else None
+    if not fcntl or not path or path == ':memory:':
+        yield
+        return
+    with open(os.path.abspath(path) + '.upgrade-lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def upgrade():
+    """Bring the database up to LATEST. Call inside an app context."""
+    if recorded_version() == LATEST:
+        return LATEST   # the usual start: one SELECT, no lock
+    with upgrade_lock():
+        version = current_version()   # re-read: another worker may have just finished
+        for number, description, step in MIGRATIONS:
+            if number <= version:
+                continue
+            print(f"Applying schema migration {number}: {description}")
+            step()
+            db.session.execute(text('UPDATE schema_version SET version = :v WHERE version < :v'), {'v': number})
+            db.session.commit()
+    return LATEST
@@ -0,0 +1,51 @@
+# singleflight.py
+"""Collapse concurrent identical calls into one.
+
+    results, shared = searches.do(key, fn, *args)
+
+The first caller for ``key`` runs ``fn``; anyone asking for the same key
+while it runs waits for that result (or exception) instead of starting
+their own. Nothing is remembered once the call finishes - that is the
+cache's job - so this only removes the thundering herd of a class hitting
+"search" at the same moment. Per process; the shared SQLite cache covers
+the other workers once the first result lands.
+"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn, *args):
+        """Return (result, shared) where shared is True if another caller did the work."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'leaders': self.leaders, 'followers': self.followers}
@@ -1,5 +1,5 @@
 from dotenv import load_dotenv
-import requests
+from http_client import client
 import os
 from config import Config
 
@@ -19,7 +19,7 @@ params = {
     'key': API_KEY
 }
 
-r = requests.get(url, params=params)
+r = client.get(url, params=params)
 data = r.json()
 print(f"Status: {r.status_code}")
 if 'error' in data:
@@ -30,3 +30,5 @@ elif data.get('items'):
         print(f"- {item['snippet']['title']}")
 else:
     print("❌ No results - try a broader query or check quota")
+
+print(f"HTTP stats: {client.stats()}")
@@ -0,0 +1,169 @@
+# transcript_index.py
+"""Persistent term-frequency index over YouTube transcripts.
+
+A transcript is downloaded and tokenised once; after that only its term
+counts are kept, in SQLite next to the response cache. Relevance against a
+topic is scored with BM25 using document frequencies from every transcript
+indexed so far, so matching a topic is a handful of indexed lookups instead
+of a transcript download plus a substring scan.
+
+The corpus-wide BM25 inputs - document count, total length and each term's
+document frequency - are kept as running totals (``transcript_stats``,
+``transcript_df``) updated by ``add``, so scoring never aggregates over
+the whole index and costs the same however many transcripts it holds.
+"""
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from config import Config
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Standard BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class TranscriptIndex:
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_doc (
+                    video_id   TEXT PRIMARY KEY,
+                    length     INTEGER NOT NULL,
+                    indexed_at REAL NOT NULL
+                )""")
+            # (term, video_id) order so document frequency is an index range scan
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_term (
+                    term     TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    tf       INTEGER NOT NULL,
+                    PRIMARY KEY (term, video_id)
+                ) WITHOUT ROWID""")
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_transcript_term_video ON transcript_term (video_id)')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_stats (
+                    id           INTEGER PRIMARY KEY CHECK (id = 1),
+                    n_docs       INTEGER NOT NULL,
+                    total_length INTEGER NOT NULL
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_df (
+                    term TEXT PRIMARY KEY,
+                    df   INTEGER NOT NULL
+                ) WITHOUT ROWID""")
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                if conn.execute('SELECT 1 FROM transcript_stats').fetchone() is None:
+                    self._rebuild_totals(conn)   # index built before the totals existed
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _rebuild_totals(conn):
+        """Recount the running totals from the index itself (inside a transaction)."""
+        conn.execute('DELETE FROM transcript_df')
+        conn.execute('INSERT INTO transcript_df (term, df) SELECT term, COUNT(*) FROM transcript_term GROUP BY term')
+        conn.execute('INSERT OR REPLACE INTO transcript_stats (id, n_docs, total_length) '
+                     'SELECT 1, COUNT(*), COALESCE(SUM(length), 0) FROM transcript_doc WHERE length > 0')
+
+    @staticmethod
+    def _forget(conn, video_id):
+        """Take one transcript's terms and length back out of the index and totals."""
+        row = conn.execute('SELECT length FROM transcript_doc WHERE video_id = ?', (video_id,)).fetchone()
+        if row and row[0]:
+            conn.execute('UPDATE transcript_stats SET n_docs = n_docs - 1, total_length = total_length - ?',
+                         (row[0],))
+        conn.execute('UPDATE transcript_df SET df = df - 1 '
+                     'WHERE term IN (SELECT term FROM transcript_term WHERE video_id = ?)', (video_id,))
+        conn.execute('DELETE FROM transcript_term WHERE video_id = ?', (video_id,))
+
+    def is_indexed(self, video_id, max_age):
+        row = self._conn().execute(
+            'SELECT indexed_at FROM transcript_doc WHERE video_id = ?', (video_id,)).fetchone()
+        return row is not None and row[0] > time.time() - max_age
+
+    def add(self, video_id, text):
+        """(Re)index one transcript. An empty text records 'no transcript'."""
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._forget(conn, video_id)
+            conn.execute('INSERT OR REPLACE INTO transcript_doc (video_id, length, indexed_at) VALUES (?, ?, ?)',
+                         (video_id, length, time.time()))
+            conn.executemany('INSERT INTO transcript_term (term, video_id, tf) VALUES (?, ?, ?)',
+                             [(term, video_id, tf) for term, tf in counts.items()])
+            if length:
+                conn.execute('UPDATE transcript_stats SET n_docs = n_docs + 1, total_length = total_length + ?',
+                             (length,))
+            conn.executemany('INSERT INTO transcript_df (term, df) VALUES (?, 1) '
+                             'ON CONFLICT (term) DO UPDATE SET df = df + 1', [(term,) for term in counts])
+
+    def score(self, video_id, query):
+        """BM25 score of ``query`` against one transcript, normalised to 0..1.
+
+        Each term's contribution is divided by its ceiling (idf * (k1 + 1)),
+        so a transcript that mentions every query term often scores close
+        to 1 and one that mentions none scores 0.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return 0
+        conn = self._conn()
+        doc = conn.execute('SELECT length FROM transcript_doc WHERE video_id = ?', (video_id,)).fetchone()
+        if not doc or not doc[0]:
+            return 0
+        n_docs, total_length = conn.execute(
+            'SELECT n_docs, total_length FROM transcript_stats WHERE id = 1').fetchone()
+        avg_len = total_length / n_docs if n_docs else None
+
+        placeholders = ','.join('?' * len(terms))
+        df = dict(conn.execute(
+            f'SELECT term, df FROM transcript_df WHERE term IN ({placeholders})', tuple(terms)).fetchall())
+        tf = dict(conn.execute(
+            f'SELECT term, tf FROM transcript_term WHERE video_id = ? AND term IN ({placeholders})',
+            (video_id, *terms)).fetchall())
+
+        norm = 1 - BM25_B + BM25_B * doc[0] / (avg_len or doc[0])
+        score = ceiling = 0
+        for term in terms:
+            idf = math.log(1 + (n_docs - df.get(term, 0) + 0.5) / (df.get(term, 0) + 0.5))
+            ceiling += idf * (BM25_K1 + 1)
+            f = tf.get(term, 0)
+            score += idf * f * (BM25_K1 + 1) / (f + BM25_K1 * norm)
+        return score / ceiling if ceiling else 0
+
+    def prune(self, max_age):
+        """Forget transcripts indexed longer than ``max_age`` seconds ago."""
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN')
+            cutoff = time.time() - max_age
+            conn.execute('DELETE FROM transcript_term WHERE video_id IN '
+                         '(SELECT video_id FROM transcript_doc WHERE indexed_at < ?)', (cutoff,))
+            conn.execute('DELETE FROM transcript_doc WHERE indexed_at < ?', (cutoff,))
+            self._rebuild_totals(conn)   # maintenance only, so a full recount is fine
+
+
+transcript_index = TranscriptIndex(Config.TRANSCRIPT_INDEX_PATH)
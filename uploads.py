@@ -0,0 +1,189 @@
+# uploads.py
+"""Resumable, chunked SkillShare video uploads.
+
+The protocol is a small subset of tus (https://tus.io):
+
+    POST   /skillshare/uploads         JSON {filename, size, title, description?, sha256?}
+                                       -> 201 {upload_id, offset, chunk_size}
+    HEAD   /skillshare/uploads/<id>    -> Upload-Offset / Upload-Length headers
+    PATCH  /skillshare/uploads/<id>    raw bytes, Upload-Offset header, optional
+                                       Upload-Checksum: sha256 <base64 digest>
+                                       -> {offset} or, after the last byte, {offset, post_id}
+    DELETE /skillshare/uploads/<id>    abandon it
+
+Each chunk is copied from the request stream to
+``UPLOAD_FOLDER/.partial/<id>.part`` a block at a time, so memory use does
+not depend on the chunk or file size. ``received`` only moves forward once
+a chunk is fully on disk (and matched its checksum), so a dropped
+connection just means re-sending from the last acknowledged offset. The
+SkillPost row is created only when the whole file has arrived.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from config import Config
+from models import db, SkillPost, UploadSession
+import media
+
+try:
+    import fcntl
+except ImportError:   # Windows: fall back to the conditional UPDATE alone
+    fcntl = None
+
+ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi'}
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def partial_path(upload_id):
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{upload_id}.part")
+
+
+def parse_checksum(header):
+    """'sha256 <base64>' (tus Upload-Checksum) -> (hash object, expected digest)"""
+    try:
+        algorithm, encoded = header.split(' ', 1)
+        expected = base64.b64decode(encoded, validate=True)
+        return hashlib.new(algorithm.lower()), expected
+    except (ValueError, binascii.Error):
+        raise UploadError('Malformed Upload-Checksum header')
+
+
+def start(user_id, filename, size, title, description=None, sha256=None):
+    """Open an upload session after checking the declared file."""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        raise UploadError('Only MP4, MOV, AVI files are allowed.')
+    if not title:
+        raise UploadError('Title and video are required.')
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        raise UploadError('size must be a positive number of bytes')
+    if size > Config.UPLOAD_MAX_BYTES:
+        raise UploadError(f"Videos are limited to {Config.UPLOAD_MAX_BYTES // (1024 * 1024)} MB", 413)
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256.lower())):
+        raise UploadError('sha256 must be a hex digest')
+
+    upload = UploadSession(id=uuid.uuid4().hex, user_id=user_id, title=title[:200],
+                           description=description, extension=ext, size=size,
+                           sha256=sha256.lower() if sha256 else None)
+    db.session.add(upload)
+    db.session.commit()
+    open(partial_path(upload.id), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, checksum=None):
+    """Append one chunk at ``offset`` and return the new offset.
+
+    Bytes past the acknowledged offset (from an earlier, interrupted
+    attempt) are overwritten and truncated away.
+    """
+    path = partial_path(upload.id)
+    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+        if fcntl:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('Another chunk for this upload is still being written', 409)
+        db.session.refresh(upload)
+        if offset != upload.received:
+            raise UploadError(f"Upload-Offset {offset} does not match the server's {upload.received}", 409)
+
+        digest, expected = parse_checksum(checksum) if checksum else (None, None)
+        limit = upload.size - offset
+        written = 0
+        f.seek(offset)
+        while True:
+            block = stream.read(BLOCK_SIZE)
+            if not block:
+                break
+            written += len(block)
+            if written > limit:
+                f.truncate(offset)
+                raise UploadError('Chunk runs past the declared file size', 413)
+            f.write(block)
+            if digest:
+                digest.update(block)
+        f.truncate(offset + written)
+
+        if digest and digest.digest() != expected:
+            f.truncate(offset)
+            raise UploadError('Chunk checksum mismatch, send it again', 460)
+        f.flush()
+        os.fsync(f.fileno())
+
+        # The lock keeps writers apart; the WHERE keeps the offset honest without it
+        res = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload.id, UploadSession.received == offset)
+            .values(received=offset + written, updated_at=datetime.utcnow()))
+        if res.rowcount == 0:
+            db.session.rollback()
+            raise UploadError('Upload moved on while this chunk was written', 409)
+        db.session.commit()
+    return offset + written
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete(upload):
+    """Move the finished file into UPLOAD_FOLDER, create its SkillPost and queue processing."""
+    path = partial_path(upload.id)
+    if upload.sha256 and _file_sha256(path) != upload.sha256:
+        abandon(upload)
+        raise UploadError('File checksum mismatch, please upload it again', 422)
+
+    filename = f"{uuid.uuid4().hex}.{upload.extension}"
+    dst = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    os.replace(path, dst)
+    try:
+        post = SkillPost(title=upload.title, description=upload.description,
+                         video_filename=filename, user_id=upload.user_id, status='processing')
+        db.session.add(post)
+        db.session.delete(upload)
+        db.session.commit()
+    except BaseException:
+        # The session row is still there: put the bytes back so completing can be retried
+        db.session.rollback()
+        os.replace(dst, path)
+        raise
+    media.submit(post.id)
+    return post
+
+
+def abandon(upload):
+    db.session.delete(upload)
+    db.session.commit()
+    try:
+        os.remove(partial_path(upload.id))
+    except FileNotFoundError:
+        pass
+
+
+def prune(max_age=None):
+    """Drop sessions untouched for max_age seconds, with their partial files."""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age or Config.UPLOAD_SESSION_TTL)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in stale:
+        abandon(upload)
+    return len(stale)